@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 用法：
+'''
+    python benchmarks/import_time.py                          # 测量各个入口的冷启动导入时间
+    python benchmarks/import_time.py --save baseline.json     # 保存为基线
+    python benchmarks/import_time.py --baseline baseline.json # 与基线比较，变慢超过 --tolerance 时返回非零退出码
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = [
+    'pytorch_utils',
+    'pytorch_utils.utils',
+    'pytorch_utils.logger',
+    'pytorch_utils.early_stopping',
+    'pytorch_utils.checkpoint',
+    'pytorch_utils.results',
+    'pytorch_utils.registry',
+    'plot_utils',
+    'plot_utils.figure_cache',
+]
+
+# 只导入这些模块时不应该被导入的重依赖
+HEAVY_MODULES = ['torch', 'matplotlib', 'sklearn', 'openpyxl', 'pandas', 'seaborn']
+
+PROBE = '''
+import sys, time
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+print(elapsed, ','.join(m for m in {heavy!r} if m in sys.modules))
+'''
+
+
+def measure(module: str, repeat: int) -> tuple:
+    """
+    在新的解释器中导入 module，返回导入时间的中位数（秒）和被顺带导入的重依赖
+    :param module: 模块名
+    :param repeat: 重复次数
+    :return: (中位数, [重依赖, ...])
+    """
+    times, heavy = [], []
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                             capture_output=True, text=True, env=env, check=True).stdout.split()
+        times.append(float(out[0]))
+        heavy = out[1].split(',') if len(out) > 1 else []
+    return statistics.median(times), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold import time of the package entry points.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--modules', nargs='*', default=ENTRY_POINTS)
+    parser.add_argument('--save', default=None, help='write the results to a JSON baseline file')
+    parser.add_argument('--baseline', default=None, help='compare against a JSON baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf8') as f:
+            baseline = json.load(f)
+
+    results, regressed = {}, []
+    start = time.perf_counter()
+    for module in args.modules:
+        elapsed, heavy = measure(module, args.repeat)
+        results[module] = elapsed
+        line = f'{module:<32} {elapsed * 1000:8.1f} ms'
+        if module in baseline:
+            ratio = elapsed / baseline[module]
+            line += f'  ({ratio:.2f}x baseline)'
+            if ratio > 1 + args.tolerance:
+                regressed.append(module)
+        if heavy:
+            line += f'  imports: {", ".join(heavy)}'
+        print(line)
+    print(f'total {time.perf_counter() - start:.1f}s')
+
+    if args.save is not None:
+        with open(args.save, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=2)
+    if regressed:
+        print(f'slower than baseline: {", ".join(regressed)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import importlib
+
+# 导出名 -> 所在的子模块，第一次访问时才导入对应的子模块（PEP 562），
+# import plot_utils 本身不会导入 matplotlib、seaborn
+_EXPORTS = {
+    'FigureCache': 'figure_cache',
+    'add_annotations': 'optimization',
+    'adjust_subplots': 'optimization',
+    'create_figure': 'optimization',
+    'format_axes': 'optimization',
+    'optimize_plot': 'optimization',
+    'save_plot_as_pdf': 'optimization',
+    'set_legend': 'optimization',
+    'set_line_styles': 'optimization',
+    'set_paper_style': 'optimization',
+    'plot_bar_chart': 'plot_bar_chart',
+    'plot_double_line': 'plot_double_line',
+    'plot_multiple_bars': 'plot_multiple_bars',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value  # 之后的访问不再经过 __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import hashlib
+import inspect
+import os
+import shutil
+
+
+def feed_hash(h, obj):
+    """
+    把任意嵌套的数据写入哈希，numpy 数组和张量按字节哈希，其余对象按 repr 哈希
+    :param h: hashlib 对象
+    :param obj: 数据
+    """
+    import numpy as np
+
+    if isinstance(obj, np.ndarray) or hasattr(obj, 'detach'):  # numpy 数组或者 torch.Tensor
+        from pytorch_utils.visual_embedding import to_numpy
+
+        obj = to_numpy(obj)
+        h.update(f'ndarray{obj.dtype}{obj.shape}'.encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        h.update(b'dict')
+        for k, v in obj.items():
+            feed_hash(h, k)
+            feed_hash(h, v)
+    elif isinstance(obj, (list, tuple)):
+        h.update(f'{type(obj).__name__}{len(obj)}'.encode())
+        for v in obj:
+            feed_hash(h, v)
+    else:
+        h.update(f'{type(obj).__name__}:{obj!r};'.encode())
+
+
+def source_digest(func) -> str:
+    """绘图函数的源码哈希，修改绘图代码之后缓存自动失效"""
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = func.__qualname__
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class FigureCache:
+    """Content-addressed cache of rendered figure files with size-bounded LRU eviction."""
+
+    def __init__(self, cache_dir=None, max_bytes=512 * 2 ** 20, link=True):
+        """
+        :param cache_dir: 缓存目录，默认为环境变量 FIGURE_CACHE_DIR 或 ~/.cache/codevault/figures
+        :param max_bytes: 缓存的最大字节数，超出后删除最久没有使用的条目
+        :param link: 命中时是否用硬链接代替复制（同一文件系统上才有效，否则退回到复制）
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get('FIGURE_CACHE_DIR',
+                                       os.path.join(os.path.expanduser('~'), '.cache', 'codevault', 'figures'))
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.link = link
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, func, args=(), kwargs=None, depends=()) -> str:
+        """
+        由绘图函数的源码、输入数据、样式参数和 rcParams 计算缓存的键
+        :param func: 绘图函数
+        :param args: 位置参数
+        :param kwargs: 关键字参数
+        :param depends: func 调用的其他绘图函数，或者作为版本号的字符串；只哈希 func 本身的源码，
+                        实际绘图在其他函数中完成时需要把它们也列出来，修改之后缓存才会失效
+        :return: 十六进制字符串
+        """
+        import matplotlib as mpl
+
+        h = hashlib.sha256()
+        for f in (func, *depends):
+            if callable(f):
+                h.update(f'{f.__module__}.{f.__qualname__}:{source_digest(f)}'.encode())
+            else:
+                h.update(f'salt:{f!r}'.encode())
+        feed_hash(h, tuple(args))
+        feed_hash(h, dict(sorted((kwargs or {}).items())))
+        feed_hash(h, sorted((k, repr(v)) for k, v in mpl.rcParams.items()))
+        return h.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _place(self, src: str, dst: str) -> None:
+        # 先删除旧文件，避免通过硬链接修改缓存中的文件
+        if os.path.lexists(dst):
+            os.remove(dst)
+        dst_dir = os.path.dirname(dst)
+        if dst_dir:
+            os.makedirs(dst_dir, exist_ok=True)
+        if self.link:
+            try:
+                os.link(src, dst)
+                return
+            except OSError:
+                pass
+        shutil.copyfile(src, dst)
+
+    def fetch(self, key: str, outputs: list) -> bool:
+        """
+        缓存命中时把缓存的文件放到 outputs，否则返回 False
+        :param key: 缓存的键
+        :param outputs: 输出文件路径列表
+        :return: 是否命中
+        """
+        entry = self._entry_dir(key)
+        cached = [os.path.join(entry, f'{i}_{os.path.basename(p)}') for i, p in enumerate(outputs)]
+        if not all(os.path.exists(p) for p in cached):
+            return False
+        for src, dst in zip(cached, outputs):
+            self._place(src, dst)
+        os.utime(entry)  # 记录最近使用时间
+        return True
+
+    def store(self, key: str, outputs: list) -> None:
+        """
+        把渲染好的文件复制到缓存中，并按最近使用时间淘汰超出容量的条目
+        :param key: 缓存的键
+        :param outputs: 输出文件路径列表
+        """
+        entry = self._entry_dir(key)
+        tmp_entry = f'{entry}.tmp.{os.getpid()}'
+        os.makedirs(tmp_entry, exist_ok=True)
+        for i, p in enumerate(outputs):
+            shutil.copyfile(p, os.path.join(tmp_entry, f'{i}_{os.path.basename(p)}'))
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.replace(tmp_entry, entry)
+        self.evict()
+
+    def evict(self) -> None:
+        """删除最久没有使用的条目，直到缓存大小不超过 max_bytes"""
+        entries = []
+        total = 0
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, name)
+                if '.tmp.' in name:
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+                total += size
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def render(self, func, outputs: list, args=(), kwargs=None, ignore=(), depends=()):
+        """
+        缓存命中时直接复用 outputs，否则调用 func(*args, **kwargs) 重新绘制并写入缓存
+        :param func: 绘图函数，需要把图写到 outputs 中
+        :param outputs: 绘图函数生成的文件路径列表
+        :param args: 位置参数
+        :param kwargs: 关键字参数
+        :param ignore: 不影响绘图结果、不参与计算缓存键的关键字参数名，例如 num_workers
+        :param depends: 见 make_key
+        :return: 命中时返回 None，否则返回 func 的返回值
+        """
+        kwargs = kwargs or {}
+        key = self.make_key(func, args, {k: v for k, v in kwargs.items() if k not in ignore}, depends)
+        if self.fetch(key, outputs):
+            return None
+        for p in outputs:
+            if os.path.lexists(p):
+                os.remove(p)
+        result = func(*args, **kwargs)
+        self.store(key, outputs)
+        return result
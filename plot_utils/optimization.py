@@ -2,9 +2,6 @@
 # @Time    : 2025/3/9
 # @Author  : Zhong Zhijie
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-
 
 def save_plot_as_pdf(fig, filename, dpi=300, pad_inches=0.1):
     """
@@ -26,6 +23,9 @@ def set_paper_style():
     """
     设置适用于论文的 Matplotlib 样式。
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     plt.rcParams.update({
         # "text.usetex": True,  # 启用 LaTeX 以获得更好的公式排版
         "font.family": "serif",  # 设定字体为衬线体
@@ -109,6 +109,8 @@ def create_figure(figsize=(3.5, 2.5)):
     fig, ax : tuple
         返回 Matplotlib 图像和轴对象。
     """
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=figsize)
     return fig, ax
 
@@ -3,10 +3,8 @@
 # @Author  : Zhong Zhijie
 import os
 
-import matplotlib.pyplot as plt
 
-
-def plot_bar_chart(labels, data, x_label, y_label, filename, bar_color='skyblue'):
+def plot_bar_chart(labels, data, x_label, y_label, filename, bar_color='skyblue', cache=None):
     """
     绘制柱状图并保存为 PDF 文件。
 
@@ -17,7 +15,14 @@ def plot_bar_chart(labels, data, x_label, y_label, filename, bar_color='skyblue'
     - y_label: Y 轴标签
     - output_filename: 输出 PDF 文件名（不带扩展名）
     - bar_color: 柱状图颜色，默认为 'skyblue'
+    - cache: FigureCache，数据和样式都没有变化时直接复用之前生成的 PDF，不再重新绘制
     """
+    import matplotlib.pyplot as plt
+
+    if cache is not None:
+        return cache.render(plot_bar_chart, [f'figs/{filename}.pdf'],
+                            (labels, data, x_label, y_label, filename, bar_color))
+
     plt.figure(figsize=(7, 6))  # 设置图表大小
     bars = plt.bar(labels, data, color=bar_color)  # 绘制柱状图
 
@@ -40,26 +45,26 @@ def plot_bar_chart(labels, data, x_label, y_label, filename, bar_color='skyblue'
     plt.show()  # 显示图表
 
 
-# 示例
-model_names = ["GNAE", "ARGA", "ARVGA", "A$^3$VGAE"]
-execution_times = [27.7, 35.0, 36.4, 32.1]
-dataset_name = 'Cora'
-time_label = 'Time cost (sec)'
-chart_color = 'skyblue'
-
-plot_bar_chart(model_names, execution_times, dataset_name, time_label, 'bar_chart1', chart_color)
-#
-# execution_times = [30.5, 35.6, 36.3, 41.2]
-# dataset_name = 'Citeseer'
-# plot_bar_chart(model_names, execution_times, dataset_name, time_label, 'bar_chart2', chart_color)
-#
-#
-# execution_times = [185.8, 210.4, 221.1, 247.1]
-# dataset_name = 'PubMed'
-# plot_bar_chart(model_names, execution_times, dataset_name, time_label, 'bar_chart3', chart_color)
-#
-#
-# execution_times = [214.5, 267.3, 265.7, 287.4]
-# dataset_name = 'ScholarNet'
-# plot_bar_chart(model_names, execution_times, dataset_name, time_label, 'bar_chart4', chart_color)
+if __name__ == '__main__':
+    # 示例
+    model_names = ["GNAE", "ARGA", "ARVGA", "A$^3$VGAE"]
+    execution_times = [27.7, 35.0, 36.4, 32.1]
+    dataset_name = 'Cora'
+    time_label = 'Time cost (sec)'
+    chart_color = 'skyblue'
 
+    plot_bar_chart(model_names, execution_times, dataset_name, time_label, 'bar_chart1', chart_color)
+    #
+    # execution_times = [30.5, 35.6, 36.3, 41.2]
+    # dataset_name = 'Citeseer'
+    # plot_bar_chart(model_names, execution_times, dataset_name, time_label, 'bar_chart2', chart_color)
+    #
+    #
+    # execution_times = [185.8, 210.4, 221.1, 247.1]
+    # dataset_name = 'PubMed'
+    # plot_bar_chart(model_names, execution_times, dataset_name, time_label, 'bar_chart3', chart_color)
+    #
+    #
+    # execution_times = [214.5, 267.3, 265.7, 287.4]
+    # dataset_name = 'ScholarNet'
+    # plot_bar_chart(model_names, execution_times, dataset_name, time_label, 'bar_chart4', chart_color)
@@ -2,12 +2,11 @@
 # @Time    : 2025/3/7
 # @Author  : Zhong Zhijie
 
-import matplotlib.pyplot as plt
 import os
 
 
 # 画Parameter Tuning的图
-def plot_double_line(x, y1, y2, x_index, xlabel, labels, colors, filename):
+def plot_double_line(x, y1, y2, x_index, xlabel, labels, colors, filename, cache=None):
     """
     绘制两条折线图，并保存为PDF文件。
 
@@ -20,12 +19,19 @@ def plot_double_line(x, y1, y2, x_index, xlabel, labels, colors, filename):
     - labels: 图例标签（列表，包含两个字符串）
     - colors: 颜色列表（列表，包含两个颜色代码字符串）
     - filename: 保存的PDF文件名（字符串）
+    - cache: FigureCache，数据和样式都没有变化时直接复用之前生成的 PDF，不再重新绘制
     """
-    # 设置字体
+    import matplotlib.pyplot as plt
+
+    # 设置字体（在计算缓存键之前设置，每次调用的 rcParams 相同）
     plt.rcParams["font.sans-serif"] = ["Times New Roman"]
     # 解决负号显示问题
     plt.rcParams["axes.unicode_minus"] = False
 
+    if cache is not None:
+        return cache.render(plot_double_line, [f'figs/{filename}.pdf'],
+                            (x, y1, y2, x_index, xlabel, labels, colors, filename))
+
     plt.figure(figsize=(7, 6))
     plt.xticks(fontsize=16)
     plt.yticks(fontsize=16)
@@ -59,44 +65,45 @@ def plot_double_line(x, y1, y2, x_index, xlabel, labels, colors, filename):
     plt.show()  # 显示图表
 
 
-# 示例一
+if __name__ == '__main__':
+    # 示例一
 
-# x数据
-x = [1, 2, 3, 4, 5]
-x_index = ['32', '64', '128', '256', 512]
-xlabel = 'Dimension of the second hidden layer'
+    # x数据
+    x = [1, 2, 3, 4, 5]
+    x_index = ['32', '64', '128', '256', 512]
+    xlabel = 'Dimension of the second hidden layer'
 
-# y1和y2数据
-y1 = [0.9405, 0.9432, 0.9497, 0.9640, 0.9583]
-y2 = [0.9451, 0.9526, 0.9583, 0.9676, 0.9653]
+    # y1和y2数据
+    y1 = [0.9405, 0.9432, 0.9497, 0.9640, 0.9583]
+    y2 = [0.9451, 0.9526, 0.9583, 0.9676, 0.9653]
 
-# 调用函数，传入labels和colors
-labels = ['AUC', 'AP']
-colors = ['#4169E1', '#FF0000']
+    # 调用函数，传入labels和colors
+    labels = ['AUC', 'AP']
+    colors = ['#4169E1', '#FF0000']
 
-filename = 'cora_param_hl2'
+    filename = 'cora_param_hl2'
 
-plot_double_line(x, y1, y2, x_index, xlabel, labels, colors, filename)
+    plot_double_line(x, y1, y2, x_index, xlabel, labels, colors, filename)
 
 
-# 示例二
-'''
-from plot_double_line import plot_double_line
+    # 示例二
+    '''
+    from plot_double_line import plot_double_line
 
-# x数据
-x = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
-x_index = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
-xlabel = 'Number of k'
+    # x数据
+    x = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
+    x_index = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
+    xlabel = 'Number of k'
 
-# y1和y2数据
-y1 = [0.9567, 0.9571, 0.9583, 0.9617, 0.9619, 0.9625, 0.9640, 0.9631, 0.9630, 0.9631, 0.9624, 0.9631, 0.9631, 0.9621, 0.9619]
-y2 = [0.9595, 0.9623, 0.9630, 0.9657, 0.9660, 0.9658, 0.9676, 0.9666, 0.9670, 0.9667, 0.9662, 0.9665, 0.9668, 0.9662, 0.9656]
+    # y1和y2数据
+    y1 = [0.9567, 0.9571, 0.9583, 0.9617, 0.9619, 0.9625, 0.9640, 0.9631, 0.9630, 0.9631, 0.9624, 0.9631, 0.9631, 0.9621, 0.9619]
+    y2 = [0.9595, 0.9623, 0.9630, 0.9657, 0.9660, 0.9658, 0.9676, 0.9666, 0.9670, 0.9667, 0.9662, 0.9665, 0.9668, 0.9662, 0.9656]
 
-# 调用函数，传入labels和colors
-labels = ['AUC', 'AP']
-colors = ['#4169E1', '#FF0000']
+    # 调用函数，传入labels和colors
+    labels = ['AUC', 'AP']
+    colors = ['#4169E1', '#FF0000']
 
-filename = 'cora_param_k'
+    filename = 'cora_param_k'
 
-plot_double_line(x, y1, y2, x_index, xlabel, labels, colors, filename)
-'''
+    plot_double_line(x, y1, y2, x_index, xlabel, labels, colors, filename)
+    '''
@@ -3,11 +3,9 @@
 # @Author  : Zhong Zhijie
 
 import os
-import numpy as np
-import matplotlib.pyplot as plt
 
 
-def plot_multiple_bars(labels, *data, labels_list=None, colors_list=None, filename='output.pdf'):
+def plot_multiple_bars(labels, *data, labels_list=None, colors_list=None, filename='output.pdf', cache=None):
     """
     绘制多组数据的柱状图，并保存为 PDF 文件。
 
@@ -17,12 +15,21 @@ def plot_multiple_bars(labels, *data, labels_list=None, colors_list=None, filena
     - labels_list: list[str]，每组数据的图例标签（用于图例标注）。
     - colors_list: list[str]，每组数据的颜色（可选）。
     - filename: str，要保存的 PDF 文件名（不带扩展名）。
+    - cache: FigureCache，数据和样式都没有变化时直接复用之前生成的 PDF，不再重新绘制。
+      已经有打开的图形窗口时会画在已有的图上，结果无法缓存，此时忽略 cache。
     """
-    # 设置字体
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    # 设置字体（在计算缓存键之前设置，每次调用的 rcParams 相同）
     plt.rcParams["font.sans-serif"] = ["Times New Roman"]
     plt.rcParams["axes.unicode_minus"] = False  # 解决负号显示问题
     plt.rcParams['font.family'] = "Times New Roman"
 
+    if cache is not None and not plt.get_fignums():
+        return cache.render(plot_multiple_bars, [f'figs/{filename}.pdf'], (labels, *data),
+                            dict(labels_list=labels_list, colors_list=colors_list, filename=filename))
+
     x = np.arange(len(labels))  # 生成 X 轴的刻度位置
     num_data = len(data)  # 计算数据集数量
     width = 0.8 / num_data  # 根据数据集数量调整柱子的宽度
@@ -64,27 +71,28 @@ def plot_multiple_bars(labels, *data, labels_list=None, colors_list=None, filena
     plt.show()
 
 
-# 示例数据
-labels = ['Cora', 'Citeseer', 'PubMed', 'ScholarNet']
-
-# AUC 数据
-data_0 = [0.9640, 0.9784, 0.9676, 0.9910]
-data_1 = [0.9600, 0.9737, 0.9763, 0.9891]
-plot_multiple_bars(
-    labels,
-    data_0, data_1,
-    labels_list=['Asymmetry', 'Symmetry'],
-    colors_list=['#A8D8EA', '#FFC7C7'],
-    filename='issymmetry_auc'
-)
-
-# # AP 数据
-# data_0 = [0.9676, 0.9813, 0.9693, 0.9896]
-# data_1 = [0.9642, 0.9770, 0.9788, 0.9882]
-# plot_multiple_bars(
-#     labels,
-#     data_0, data_1,
-#     labels_list=['Asymmetry', 'Symmetry'],
-#     colors_list=['#A8D8EA', '#FFC7C7'],
-#     filename='issymmetry_ap'
-# )
+if __name__ == '__main__':
+    # 示例数据
+    labels = ['Cora', 'Citeseer', 'PubMed', 'ScholarNet']
+
+    # AUC 数据
+    data_0 = [0.9640, 0.9784, 0.9676, 0.9910]
+    data_1 = [0.9600, 0.9737, 0.9763, 0.9891]
+    plot_multiple_bars(
+        labels,
+        data_0, data_1,
+        labels_list=['Asymmetry', 'Symmetry'],
+        colors_list=['#A8D8EA', '#FFC7C7'],
+        filename='issymmetry_auc'
+    )
+
+    # # AP 数据
+    # data_0 = [0.9676, 0.9813, 0.9693, 0.9896]
+    # data_1 = [0.9642, 0.9770, 0.9788, 0.9882]
+    # plot_multiple_bars(
+    #     labels,
+    #     data_0, data_1,
+    #     labels_list=['Asymmetry', 'Symmetry'],
+    #     colors_list=['#A8D8EA', '#FFC7C7'],
+    #     filename='issymmetry_ap'
+    # )
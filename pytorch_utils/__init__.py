@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import importlib
+
+# 导出名 -> 所在的子模块，第一次访问时才导入对应的子模块（PEP 562），
+# import pytorch_utils 本身不会导入 torch、matplotlib 等依赖
+_EXPORTS = {
+    'get_argparse': 'arg_parse',
+    'DeltaCheckpointStore': 'checkpoint',
+    'load_sharded': 'checkpoint',
+    'save_sharded': 'checkpoint',
+    'crop_pdf': 'deal_pdf',
+    'AsyncCheckpointWriter': 'early_stopping',
+    'EarlyStopping': 'early_stopping',
+    'evaluate_embedding': 'evaluation',
+    'lazy_import': 'lazy',
+    'Logger': 'logger',
+    'MetricStream': 'logger',
+    'evaluate_classification': 'ml',
+    'pca2embedding': 'ml',
+    'svm4cls': 'ml',
+    'print_config': 'print_argments',
+    'ExperimentRegistry': 'registry',
+    'RunCache': 'run_cache',
+    'cached_run': 'run_cache',
+    'best_by_metric': 'results',
+    'scan_results': 'results',
+    'ASHA': 'sweep',
+    'current_trial': 'sweep',
+    'expand_grid': 'sweep',
+    'run_sweep': 'sweep',
+    'sample_random': 'sweep',
+    'TrainingState': 'training_state',
+    'close_logger': 'utils',
+    'create_exp_folder': 'utils',
+    'export_results': 'utils',
+    'extract_last_two_values': 'utils',
+    'get_exp_sub_folder_path': 'utils',
+    'get_logger': 'utils',
+    'load_model': 'utils',
+    'load_state_dict': 'utils',
+    'mkdir': 'utils',
+    'plot_dict_to_individual_files': 'utils',
+    'print_config_summary': 'utils',
+    'save_model': 'utils',
+    'seed_everything': 'utils',
+    'set_seed': 'utils',
+    'write_to_excel': 'utils',
+    'plot_embeddings': 'visual_embedding',
+    'project_embeddings': 'visual_embedding',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value  # 之后的访问不再经过 __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -11,6 +11,9 @@ def get_argparse():
                         help='Save path for models, logs, and other files')
     parser.add_argument('--load_model_state_dir', default='outputs/model', type=str, help='Path to the loaded model')
     parser.add_argument('--retraining', action="store_true", help='Loading the model for retraining')
+    parser.add_argument('--resume_dir', default=None, type=str,
+                        help='Experiment folder whose training state is restored to continue an interrupted run')
+    parser.add_argument('--save_state_every', default=1, type=int, help='Save the training state every N epochs')
     parser.add_argument('--seed', default=42, type=int, help='Setting the random seed')
 
     # 训练过程
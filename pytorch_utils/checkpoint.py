@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .lazy import lazy_import
+
+torch = lazy_import('torch')
+
+# 分片格式：一个目录，里面是若干个 shard-<保存编号>-xxxxx.pt 文件和一个 index.json
+# index.json 记录每个参数所在的分片，读取时只需要打开包含所需参数的分片
+INDEX_FILE = 'index.json'
+SHARD_FILE = 'shard-{}-{:05d}.pt'  # 每次保存使用新的前缀，不覆盖旧索引引用的分片
+
+
+def state_dict_to_cpu(model):
+    """
+    将模型的状态字典拷贝一份到 CPU 上，拷贝之后训练线程可以继续修改参数
+    :param model: PyTorch 模型实例
+    :return: CPU 上的状态字典
+    """
+    return {k: v.detach().to('cpu', copy=True) if torch.is_tensor(v) else v
+            for k, v in model.state_dict().items()}
+
+
+def atomic_save(obj, path):
+    """
+    先写入临时文件再重命名，保证 path 上的文件要么是旧的，要么是完整的新文件
+    :param obj: 需要保存的对象
+    :param path: 保存路径
+    :return: None
+    """
+    tmp_path = f'{path}.tmp.{os.getpid()}.{threading.get_ident()}'
+    try:
+        with open(tmp_path, 'wb') as f:
+            torch.save(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def tensor_nbytes(value) -> int:
+    """
+    计算状态字典中一个值占用的字节数，非张量按 0 计算
+    :param value: 状态字典中的值
+    :return: 字节数
+    """
+    if torch.is_tensor(value):
+        return value.numel() * value.element_size()
+    return 0
+
+
+def split_state_dict(state_dict: dict, max_shard_size: int) -> list:
+    """
+    按顺序把状态字典切分成若干个不超过 max_shard_size 字节的分片，单个超大张量独占一个分片
+    :param state_dict: 状态字典
+    :param max_shard_size: 每个分片的最大字节数
+    :return: 分片列表，每个元素是一个状态字典
+    """
+    shards = [{}]
+    shard_size = 0
+    for key, value in state_dict.items():
+        size = tensor_nbytes(value)
+        if shards[-1] and shard_size + size > max_shard_size:
+            shards.append({})
+            shard_size = 0
+        shards[-1][key] = value
+        shard_size += size
+    return shards
+
+
+def write_json(obj, path: str) -> None:
+    """先写临时文件再重命名，保证 json 文件总是完整的"""
+    tmp_path = f'{path}.tmp.{os.getpid()}'
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        json.dump(obj, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# 压缩格式：MAGIC + 4 字节头部长度 + json 头部（压缩算法、原始 dtype）+ 压缩后的 torch.save 数据
+COMPRESSED_MAGIC = b'PUCKPT1\n'
+REDUCED_DTYPES = {'fp16': 'float16', 'bf16': 'bfloat16'}
+
+
+def get_codec(name: str):
+    """
+    获取压缩算法，zstd 和 lz4 是可选依赖，未安装时 'auto' 会退回到 zlib
+    :param name: 'auto'、'zstd'、'lz4'、'zlib' 或 'none'
+    :return: (实际使用的算法名, 压缩函数, 解压函数)
+    """
+    if name == 'auto':
+        for candidate in ('zstd', 'lz4'):
+            try:
+                return get_codec(candidate)
+            except ImportError:
+                continue
+        return get_codec('zlib')
+    if name == 'zstd':
+        import zstandard
+        return name, zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    if name == 'lz4':
+        import lz4.frame
+        return name, lz4.frame.compress, lz4.frame.decompress
+    if name == 'zlib':
+        return name, partial(zlib.compress, level=6), zlib.decompress
+    if name == 'none':
+        return name, bytes, bytes
+    raise ValueError(f'Unknown codec: {name}')
+
+
+def is_compressed_checkpoint(path: str) -> bool:
+    """判断 path 是否是 save_compressed 保存的文件"""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(COMPRESSED_MAGIC)) == COMPRESSED_MAGIC
+
+
+def save_compressed(state_dict: dict, path: str, codec: str = 'auto', dtype: str = None) -> None:
+    """
+    压缩保存状态字典，可以先把浮点张量转换为半精度
+    :param state_dict: 状态字典
+    :param path: 保存路径
+    :param codec: 压缩算法，'auto'、'zstd'、'lz4'、'zlib' 或 'none'
+    :param dtype: 浮点张量的保存精度，'fp16'、'bf16' 或 None（保持原精度）
+    :return: None
+    """
+    codec, compress, _ = get_codec(codec)
+    dtypes = {}
+    if dtype is not None:
+        target = getattr(torch, REDUCED_DTYPES[dtype])
+        converted = {}
+        for k, v in state_dict.items():
+            if torch.is_tensor(v) and v.dtype in (torch.float32, torch.float64):
+                dtypes[k] = str(v.dtype).replace('torch.', '')
+                v = v.detach().to('cpu', target)
+            converted[k] = v
+        state_dict = converted
+
+    buffer = io.BytesIO()
+    torch.save(state_dict, buffer)
+    payload = compress(buffer.getbuffer())
+    header = json.dumps({'codec': codec, 'dtypes': dtypes}).encode()
+
+    tmp_path = f'{path}.tmp.{os.getpid()}.{threading.get_ident()}'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(COMPRESSED_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_compressed(path: str, device=None, weights_only: bool = None) -> dict:
+    """
+    读取 save_compressed 保存的状态字典，半精度保存的张量会转换回原来的精度
+    :param path: 文件路径
+    :param device: 目标设备，为 None 时保持保存时的设备
+    :param weights_only: 是否只反序列化张量等安全类型，为 None 时使用 torch.load 的默认值
+    :return: 状态字典
+    """
+    with open(path, 'rb') as f:
+        f.read(len(COMPRESSED_MAGIC))
+        header_size, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_size))
+        payload = f.read()
+    _, _, decompress = get_codec(header['codec'])
+
+    kwargs = {}
+    if weights_only is not None:
+        kwargs['weights_only'] = weights_only
+    state_dict = torch.load(io.BytesIO(decompress(payload)), map_location=device, **kwargs)
+    for k, dtype in header['dtypes'].items():
+        state_dict[k] = state_dict[k].to(getattr(torch, dtype))
+    return state_dict
+
+
+def load_file(path: str, map_location=None, mmap: bool = False, weights_only: bool = None):
+    """
+    读取 torch.save 或 save_compressed 保存的文件，压缩文件不支持 mmap
+    :param path: 文件路径
+    :param map_location: 传给 torch.load 的 map_location
+    :param mmap: 是否使用内存映射
+    :param weights_only: 是否只反序列化张量等安全类型，为 None 时使用 torch.load 的默认值
+    :return: 读取的对象
+    """
+    if is_compressed_checkpoint(path):
+        return load_compressed(path, device=map_location, weights_only=weights_only)
+    kwargs = {}
+    if weights_only is not None:
+        kwargs['weights_only'] = weights_only
+    if mmap:
+        kwargs['mmap'] = True
+    return torch.load(path, map_location=map_location, **kwargs)
+
+
+def get_save_func(codec: str = None, dtype: str = None):
+    """
+    根据压缩选项返回 save_func(obj, path)
+    :param codec: 压缩算法，为 None 且 dtype 也为 None 时不压缩
+    :param dtype: 浮点张量的保存精度
+    :return: 保存函数
+    """
+    if codec is None and dtype is None:
+        return atomic_save
+    return partial(save_compressed, codec=codec or 'none', dtype=dtype)
+
+
+def is_sharded_checkpoint(path: str) -> bool:
+    """判断 path 是否是分片格式的 checkpoint 目录"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, INDEX_FILE))
+
+
+def save_sharded(state_dict: dict, directory: str, max_shard_size: int = 1 << 30, num_workers: int = None,
+                 codec: str = None, dtype: str = None) -> None:
+    """
+    以分片格式保存状态字典，多个分片由线程池并行写入
+    :param state_dict: 状态字典
+    :param directory: 保存的目录
+    :param max_shard_size: 每个分片的最大字节数，默认 1GB
+    :param num_workers: 写入线程数，为 None 时使用 min(分片数, CPU 核数)
+    :param codec: 分片的压缩算法，见 save_compressed
+    :param dtype: 浮点张量的保存精度，见 save_compressed
+    :return: None
+    """
+    save_func = get_save_func(codec, dtype)
+    os.makedirs(directory, exist_ok=True)
+    shards = split_state_dict(state_dict, max_shard_size)
+    # 分片写入新的文件名，旧的索引和它引用的分片在新索引替换之前保持不变，中途中断时读到的仍是完整的旧 checkpoint
+    save_id = f'{time.time_ns():x}'
+    shard_files = [SHARD_FILE.format(save_id, i) for i in range(len(shards))]
+    if num_workers is None:
+        num_workers = min(len(shards), os.cpu_count() or 1)
+
+    with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+        futures = [executor.submit(save_func, shard, os.path.join(directory, name))
+                   for shard, name in zip(shards, shard_files)]
+        for future in futures:
+            future.result()
+
+    # 所有分片写完之后才原子地替换索引，索引存在即表示 checkpoint 完整
+    weight_map = {key: name for shard, name in zip(shards, shard_files) for key in shard}
+    index = {
+        'metadata': {'total_size': sum(tensor_nbytes(v) for v in state_dict.values()),
+                     'num_shards': len(shards)},
+        'weight_map': weight_map,
+    }
+    write_json(index, os.path.join(directory, INDEX_FILE))
+
+    # 删除之前保存留下的、已经不再被引用的分片（包括中断的保存写了一半的分片）
+    for name in os.listdir(directory):
+        if name.startswith('shard-') and name.endswith('.pt') and name not in shard_files:
+            os.remove(os.path.join(directory, name))
+
+
+def load_sharded(directory: str, device=None, mmap: bool = False, weights_only: bool = None,
+                 prefixes: list = None, num_workers: int = None) -> dict:
+    """
+    读取分片格式的状态字典，多个分片由线程池并行读取
+    :param directory: checkpoint 目录
+    :param device: 目标设备，为 None 时保持保存时的设备
+    :param mmap: 是否使用内存映射
+    :param weights_only: 是否只反序列化张量等安全类型，为 None 时使用 torch.load 的默认值
+    :param prefixes: 只读取以这些前缀开头的参数，不包含这些参数的分片不会被打开
+    :param num_workers: 读取线程数，为 None 时使用 min(分片数, CPU 核数)
+    :return: 状态字典
+    """
+    with open(os.path.join(directory, INDEX_FILE), 'r', encoding='utf8') as f:
+        index = json.load(f)
+    weight_map = index['weight_map']
+    if prefixes is not None:
+        prefixes = tuple(prefixes)
+        weight_map = {k: v for k, v in weight_map.items() if k.startswith(prefixes)}
+
+    def load_shard(name):
+        shard = load_file(os.path.join(directory, name), map_location='cpu' if mmap else device, mmap=mmap,
+                          weights_only=weights_only)
+        shard = {k: v for k, v in shard.items() if k in weight_map}
+        if mmap and device is not None:
+            shard = {k: v.to(device) for k, v in shard.items()}
+        return shard
+
+    shard_files = sorted(set(weight_map.values()))
+    if num_workers is None:
+        num_workers = min(len(shard_files), os.cpu_count() or 1)
+    state_dict = {}
+    with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+        for shard in executor.map(load_shard, shard_files):
+            state_dict.update(shard)
+    # 保持与保存时一致的参数顺序
+    return {k: state_dict[k] for k in weight_map}
+
+
+def tensor_digest(value) -> str:
+    """
+    计算状态字典中一个值的内容哈希，张量的哈希包含 dtype、shape 和数据
+    :param value: 状态字典中的值
+    :return: 十六进制哈希字符串
+    """
+    h = hashlib.blake2b(digest_size=20)
+    if torch.is_tensor(value):
+        tensor = value.detach().cpu().contiguous()
+        h.update(f'{tensor.dtype}{tuple(tensor.shape)}'.encode())
+        # 按字节查看张量，bfloat16 等 numpy 不支持的类型也可以直接哈希
+        h.update(memoryview(tensor.reshape(-1).view(torch.uint8).numpy()))
+    else:
+        h.update(pickle.dumps(value))
+    return h.hexdigest()
+
+
+# 增量格式：一个目录，blobs 下按内容哈希保存每个张量，manifests 下每个版本一个 json，记录参数名到哈希的映射
+# 只有内容发生变化的张量才会写新的 blob，冻结的参数在所有版本之间共享同一个 blob
+MANIFEST_DIR = 'manifests'
+BLOB_DIR = 'blobs'
+
+
+def is_delta_store(path: str) -> bool:
+    """判断 path 是否是增量格式的 checkpoint 目录"""
+    return os.path.isdir(os.path.join(path, MANIFEST_DIR))
+
+
+class DeltaCheckpointStore:
+    """Content-addressed checkpoint store that only writes tensors whose bytes changed since earlier saves."""
+
+    def __init__(self, directory: str):
+        """
+        :param directory: 保存 checkpoint 的目录
+        """
+        self.directory = directory
+        self.manifest_dir = os.path.join(directory, MANIFEST_DIR)
+        self.blob_dir = os.path.join(directory, BLOB_DIR)
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], f'{digest}.pt')
+
+    def _manifest_path(self, version: int) -> str:
+        return os.path.join(self.manifest_dir, f'{version:06d}.json')
+
+    def versions(self) -> list:
+        """返回所有已保存的版本号（升序）"""
+        return sorted(int(name[:-5]) for name in os.listdir(self.manifest_dir) if name.endswith('.json'))
+
+    def manifest(self, version: int = None) -> dict:
+        """读取指定版本的 manifest，为 None 时读取最新版本"""
+        if version is None:
+            versions = self.versions()
+            if not versions:
+                raise FileNotFoundError(f'No checkpoint saved in {self.directory}')
+            version = versions[-1]
+        with open(self._manifest_path(version), 'r', encoding='utf8') as f:
+            return json.load(f)
+
+    def save(self, state_dict: dict, tag: str = None) -> int:
+        """
+        保存一个新版本，只写入内容发生变化的张量
+        :param state_dict: 状态字典
+        :param tag: 版本的备注，例如 'epoch_10'
+        :return: 新的版本号
+        """
+        with self._lock:
+            tensors = {}
+            written = 0
+            for key, value in state_dict.items():
+                # 每次都按字节计算哈希：新分配的张量可能复用旧地址且版本号为 0，通过 .data 的修改也不会增加版本号，
+                # 用地址和版本号缓存哈希会把已经改变的张量误认为没有变化
+                digest = tensor_digest(value)
+                tensors[key] = digest
+                blob_path = self._blob_path(digest)
+                if not os.path.exists(blob_path):
+                    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                    # clone 避免把视图背后整个 storage 一起保存
+                    atomic_save(value.detach().cpu().clone() if torch.is_tensor(value) else value, blob_path)
+                    written += 1
+            return self._write_manifest({'tag': tag, 'time': time.time(), 'written': written, 'tensors': tensors})
+
+    def _write_manifest(self, manifest: dict) -> int:
+        """
+        写入新版本的 manifest。多个进程可能同时保存到同一个目录（例如 sweep 的多个工作进程），线程锁无法保证版本号唯一，
+        所以先写完整的临时文件，再用 os.link 以独占方式创建版本文件：目标已存在时失败，换下一个版本号重试，
+        读者也不会看到写了一半的 manifest
+        :return: 新的版本号
+        """
+        tmp_path = os.path.join(self.manifest_dir, f'manifest.tmp.{os.getpid()}.{threading.get_ident()}')
+        try:
+            versions = self.versions()
+            version = versions[-1] + 1 if versions else 1
+            while True:
+                manifest['version'] = version
+                with open(tmp_path, 'w', encoding='utf8') as f:
+                    json.dump(manifest, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                try:
+                    os.link(tmp_path, self._manifest_path(version))
+                    return version
+                except FileExistsError:
+                    version += 1
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self, version: int = None, device=None, mmap: bool = False, weights_only: bool = None,
+             prefixes: list = None, num_workers: int = None) -> dict:
+        """
+        读取指定版本的状态字典
+        :param version: 版本号，为 None 时读取最新版本
+        :param device: 目标设备，为 None 时保持保存时的设备
+        :param mmap: 是否使用内存映射
+        :param weights_only: 是否只反序列化张量等安全类型，为 None 时使用 torch.load 的默认值
+        :param prefixes: 只读取以这些前缀开头的参数
+        :param num_workers: 读取线程数，为 None 时使用 CPU 核数
+        :return: 状态字典
+        """
+        tensors = self.manifest(version)['tensors']
+        if prefixes is not None:
+            prefixes = tuple(prefixes)
+            tensors = {k: v for k, v in tensors.items() if k.startswith(prefixes)}
+
+        def load_blob(digest):
+            value = load_file(self._blob_path(digest), map_location='cpu' if mmap else device, mmap=mmap,
+                              weights_only=weights_only)
+            if mmap and device is not None and torch.is_tensor(value):
+                value = value.to(device)
+            return digest, value
+
+        digests = set(tensors.values())
+        with ThreadPoolExecutor(max_workers=max(min(len(digests), num_workers or os.cpu_count() or 1), 1)) as executor:
+            blobs = dict(executor.map(load_blob, digests))
+        return {k: blobs[d] for k, d in tensors.items()}
+
+    def compact(self, keep_last: int = None) -> int:
+        """
+        删除没有被任何 manifest 引用的 blob
+        :param keep_last: 只保留最近的 keep_last 个版本（至少为 1），为 None 时保留所有版本
+        :return: 删除的 blob 数量
+        """
+        if keep_last is not None and keep_last < 1:
+            raise ValueError(f'keep_last must be at least 1, got {keep_last}')
+        with self._lock:
+            versions = self.versions()
+            if keep_last is not None:
+                for version in versions[:max(len(versions) - keep_last, 0)]:
+                    os.remove(self._manifest_path(version))
+                versions = versions[max(len(versions) - keep_last, 0):]
+            referenced = set()
+            for version in versions:
+                referenced.update(self.manifest(version)['tensors'].values())
+
+            removed = 0
+            for sub_dir in os.listdir(self.blob_dir):
+                sub_path = os.path.join(self.blob_dir, sub_dir)
+                for name in os.listdir(sub_path):
+                    # 只处理完整的 blob，其他进程正在写入的临时文件（xxx.pt.tmp.*）不能删除
+                    if name.endswith('.pt') and name[:-3] not in referenced:
+                        os.remove(os.path.join(sub_path, name))
+                        removed += 1
+            return removed
+
+
+def benchmark_codecs(state_dict: dict, directory: str, repeat: int = 3) -> list:
+    """
+    比较不同压缩算法和保存精度的文件大小、写入时间和读取时间
+    :param state_dict: 用于测试的状态字典
+    :param directory: 临时文件保存的目录
+    :param repeat: 每种配置重复的次数，时间取最小值
+    :return: 每种配置的结果字典列表
+    """
+    os.makedirs(directory, exist_ok=True)
+    configs = [(None, None)]
+    for codec in ('zstd', 'lz4', 'zlib'):
+        try:
+            get_codec(codec)
+        except ImportError:
+            continue
+        configs.append((codec, None))
+    for dtype in REDUCED_DTYPES:
+        configs.append(('none', dtype))
+        configs.append(('auto', dtype))
+
+    results = []
+    for codec, dtype in configs:
+        path = os.path.join(directory, 'benchmark.pt')
+        save_func = get_save_func(codec, dtype)
+        write_times, read_times = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            save_func(state_dict, path)
+            write_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            load_file(path, map_location='cpu')
+            read_times.append(time.perf_counter() - start)
+        results.append({'codec': get_codec(codec)[0] if codec else 'torch.save', 'dtype': dtype or 'original',
+                        'size_mb': os.path.getsize(path) / 2 ** 20,
+                        'write_s': min(write_times), 'read_s': min(read_times)})
+        os.remove(path)
+    return results
+
+
+if __name__ == '__main__':
+    # 用法：python -m pytorch_utils.checkpoint compact outputs/exp1/model/checkpoint --keep_last 3
+    #      python -m pytorch_utils.checkpoint benchmark /tmp/ckpt_bench --checkpoint outputs/exp1/model/checkpoint.pt
+    parser = argparse.ArgumentParser(description='Maintain incremental checkpoint stores')
+    parser.add_argument('command', choices=['compact', 'list', 'benchmark'], help='Command to run')
+    parser.add_argument('directory', type=str, help='Path to the checkpoint store (working directory for benchmark)')
+    parser.add_argument('--keep_last', default=None, type=int, help='Number of latest versions to keep')
+    parser.add_argument('--checkpoint', default=None, type=str,
+                        help='Checkpoint to benchmark, a random state dict is used if not given')
+    parser.add_argument('--size_mb', default=64, type=int, help='Size of the random state dict for benchmark')
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        if args.checkpoint is not None:
+            bench_state = load_file(args.checkpoint, map_location='cpu')
+        else:
+            # 模拟训练后的权重：随机初始化的浮点数几乎无法压缩，这里作为最坏情况
+            n = args.size_mb * 2 ** 20 // 4 // 1024
+            bench_state = {f'layer{i}.weight': torch.randn(1024, 1024) * 0.02 for i in range(n // 1024)}
+            bench_state['tail.weight'] = torch.randn(n % 1024, 1024) * 0.02
+        print(f"{'codec':>10} {'dtype':>9} {'size(MB)':>9} {'write(s)':>9} {'read(s)':>9}")
+        for r in benchmark_codecs(bench_state, args.directory):
+            print(f"{r['codec']:>10} {r['dtype']:>9} {r['size_mb']:>9.2f} {r['write_s']:>9.3f} {r['read_s']:>9.3f}")
+        raise SystemExit
+
+    store = DeltaCheckpointStore(args.directory)
+    if args.command == 'compact':
+        print(f'Removed {store.compact(args.keep_last)} unreferenced blobs from {args.directory}')
+    else:
+        for v in store.versions():
+            m = store.manifest(v)
+            print(f"version {v}: tag={m['tag']}, tensors={len(m['tensors'])}, written={m['written']}")
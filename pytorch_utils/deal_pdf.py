@@ -1,46 +1,195 @@
+import hashlib
+import json
 import os
-from pypdf import PdfReader, PdfWriter
+import re
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from .checkpoint import write_json
 
 # todo: 这个函数不在需要了，因为matplotlib可以保存图片时候，可以自动去除空白区域
 
+MANIFEST_FILE = '.crop_manifest.json'
+
 
 def cm_to_points(cm):
     return cm * 28.35  # 1厘米约等于28.35点
 
 
-def crop_pdf(input_directory, left_cm, right_cm, top_cm, bottom_cm):
-    # 将厘米转换为点
-    left = cm_to_points(left_cm)
-    right = cm_to_points(right_cm)
-    top = cm_to_points(top_cm)
-    bottom = cm_to_points(bottom_cm)
+def file_digest(path: str) -> str:
+    """文件内容的 blake2b 哈希"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def tight_bboxes(input_path: str, dpi: int = 150) -> list:
+    """
+    计算每一页实际内容（非白色区域）的边界框，优先用 PyMuPDF 低分辨率渲染后查找，没有安装时使用 Ghostscript 的 bbox 设备
+    matplotlib 等工具会先画一个白色背景矩形，只看绘图指令的范围时边界框总是整页，所以按渲染结果计算
+    :param input_path: PDF 路径
+    :param dpi: 渲染的分辨率，边界框的误差约为 72 / dpi 点
+    :return: [(x0, y0, x1, y1), ...]，PDF 坐标（点，原点在左下角），空白页为 None
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        try:
+            import fitz as pymupdf
+        except ImportError:
+            pymupdf = None
+
+    if pymupdf is not None:
+        import numpy as np
+
+        bboxes = []
+        scale = 72 / dpi
+        with pymupdf.open(input_path) as doc:
+            for page in doc:
+                pix = page.get_pixmap(dpi=dpi, alpha=False)
+                pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+                ink = (pixels < 250).any(axis=2)
+                rows, cols = np.flatnonzero(ink.any(axis=1)), np.flatnonzero(ink.any(axis=0))
+                if len(rows) == 0:
+                    bboxes.append(None)
+                    continue
+                # 像素坐标 -> MuPDF 页面坐标（原点在左上角）-> PDF 坐标
+                x, y = page.rect.x0, page.rect.y0
+                rect = pymupdf.Rect(x + cols[0] * scale, y + rows[0] * scale,
+                                    x + (cols[-1] + 1) * scale, y + (rows[-1] + 1) * scale)
+                rect = rect * ~page.transformation_matrix
+                bboxes.append((rect.x0, rect.y0, rect.x1, rect.y1))
+        return bboxes
+
+    gs = shutil.which('gs')
+    if gs is None:
+        raise ImportError('crop_pdf(auto=True) requires PyMuPDF (pip install pymupdf) or Ghostscript')
+    result = subprocess.run([gs, '-q', '-dBATCH', '-dNOPAUSE', '-dSAFER', '-sDEVICE=bbox', input_path],
+                            capture_output=True, text=True, check=True)
+    bboxes = []
+    for line in result.stderr.splitlines():
+        match = re.match(r'%%HiResBoundingBox:\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)', line)
+        if match:
+            x0, y0, x1, y1 = map(float, match.groups())
+            bboxes.append((x0, y0, x1, y1) if x1 > x0 and y1 > y0 else None)
+    return bboxes
 
+
+def _crop_file(item):
+    from pypdf import PdfReader, PdfWriter
+
+    input_path, output_path, margins, padding = item
+    # 读取PDF
+    reader = PdfReader(input_path)
+    writer = PdfWriter()
+    bboxes = tight_bboxes(input_path) if margins is None else None
+
+    # 裁剪每一页
+    for i, page in enumerate(reader.pages):
+        media_box = page.mediabox
+        if margins is not None:
+            left, right, top, bottom = margins
+            page.mediabox.lower_left = (media_box.lower_left[0] + left, media_box.lower_left[1] + bottom)
+            page.mediabox.upper_right = (media_box.upper_right[0] - right, media_box.upper_right[1] - top)
+        elif i < len(bboxes) and bboxes[i] is not None:
+            x0, y0, x1, y1 = bboxes[i]
+            page.mediabox.lower_left = (max(x0 - padding, float(media_box.left)),
+                                        max(y0 - padding, float(media_box.bottom)))
+            page.mediabox.upper_right = (min(x1 + padding, float(media_box.right)),
+                                         min(y1 + padding, float(media_box.top)))
+        page.cropbox = page.mediabox
+        writer.add_page(page)
+
+    # 写入裁剪后的PDF，先写临时文件，中断时不会留下不完整的输出
+    tmp_path = f'{output_path}.tmp.{os.getpid()}'
+    with open(tmp_path, 'wb') as output_pdf:
+        writer.write(output_pdf)
+    os.replace(tmp_path, output_path)
+    return os.path.basename(input_path)
+
+
+def crop_pdf(input_directory, left_cm=0, right_cm=0, top_cm=0, bottom_cm=0, auto=False, padding_cm=0.05,
+             num_workers=None, force=False):
+    """
+    裁剪 input_directory 中所有的 PDF，结果保存到 input_directory/cropped
+    输入文件的内容哈希和裁剪参数都与上一次相同时跳过该文件，其余文件在多个进程中并行裁剪
+    :param input_directory: PDF 所在的目录
+    :param left_cm: 左边裁掉的宽度（厘米）
+    :param right_cm: 右边裁掉的宽度（厘米）
+    :param top_cm: 上边裁掉的高度（厘米）
+    :param bottom_cm: 下边裁掉的高度（厘米）
+    :param auto: 为 True 时忽略四个边距，按每一页实际内容的边界框裁剪，需要 PyMuPDF 或者 Ghostscript
+    :param padding_cm: auto 模式下在边界框外保留的宽度（厘米）
+    :param num_workers: 进程数，为 None 时使用 CPU 核数，为 1 时在当前进程中依次裁剪
+    :param force: 为 True 时重新裁剪所有文件
+    """
     # 确保输出目录存在
     output_directory = os.path.join(input_directory, 'cropped')
     os.makedirs(output_directory, exist_ok=True)
 
-    # 遍历输入目录中的所有文件
-    for filename in os.listdir(input_directory):
-        if filename.endswith('.pdf'):
-            input_path = os.path.join(input_directory, filename)
-            output_path = os.path.join(output_directory, filename)
+    # 将厘米转换为点
+    if auto:
+        params = ['auto', padding_cm]
+        margins = None
+    else:
+        params = [left_cm, right_cm, top_cm, bottom_cm]
+        margins = tuple(cm_to_points(cm) for cm in params)
+    padding = cm_to_points(padding_cm)
 
-            # 读取PDF
-            reader = PdfReader(input_path)
-            writer = PdfWriter()
+    manifest_path = os.path.join(output_directory, MANIFEST_FILE)
+    manifest = {}
+    if not force and os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
 
-            # 裁剪每一页
-            for page in reader.pages:
-                media_box = page.mediabox
-                page.mediabox.lower_left = (media_box.lower_left[0] + left, media_box.lower_left[1] + bottom)
-                page.mediabox.upper_right = (media_box.upper_right[0] - right, media_box.upper_right[1] - top)
-                writer.add_page(page)
+    # 遍历输入目录中的所有文件，大小和修改时间都没有变化时不需要重新计算哈希
+    entries, items = {}, []
+    for entry in os.scandir(input_directory):
+        if not entry.is_file() or not entry.name.endswith('.pdf'):
+            continue
+        stat = entry.stat()
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        output_path = os.path.join(output_directory, entry.name)
+        record = manifest.get(entry.name)
+        if record is not None and record['params'] == params and os.path.exists(output_path):
+            if record['stamp'] == stamp:
+                entries[entry.name] = record
+                continue
+            digest = file_digest(entry.path)
+            if record['hash'] == digest:
+                entries[entry.name] = dict(record, stamp=stamp)
+                continue
+        else:
+            digest = file_digest(entry.path)
+        entries[entry.name] = {'hash': digest, 'stamp': stamp, 'params': params}
+        items.append((entry.path, output_path, margins, padding))
 
-            # 写入裁剪后的PDF
-            with open(output_path, 'wb') as output_pdf:
-                writer.write(output_pdf)
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = min(num_workers, len(items))
+    done = set()
+    try:
+        if num_workers > 1:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                for name in executor.map(_crop_file, items):
+                    done.add(name)
+        else:
+            for item in items:
+                done.add(_crop_file(item))
+    finally:
+        # 失败的文件不写入记录，下次调用时重新裁剪
+        entries = {name: record for name, record in entries.items()
+                   if name in done or name not in {os.path.basename(item[0]) for item in items}}
+        write_json(entries, manifest_path)
 
-    print(f'All PDFs in {input_directory} have been cropped and saved to {output_directory}')
+    print(f'All PDFs in {input_directory} have been cropped and saved to {output_directory} '
+          f'({len(items)} cropped, {len(entries) - len(items)} unchanged)')
 
 
 # # 示例
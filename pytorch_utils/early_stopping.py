@@ -1,5 +1,13 @@
-import numpy as np
-import torch
+import queue
+import threading
+import time
+import weakref
+
+from .checkpoint import DeltaCheckpointStore, atomic_save, get_save_func, state_dict_to_cpu
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+torch = lazy_import('torch')
 
 # 原仓库地址：https://github.com/Bjarten/early-stopping-pytorch/tree/master
 # 用法：
@@ -20,13 +28,100 @@ import torch
                 print("Early stopping")
                 # 结束模型训练
                 break
+
+    异步保存：checkpoint 较大时，torch.save 会阻塞训练循环，可以开启 async_save
+    early_stopping = EarlyStopping(patience, verbose=True, async_save=True)
+    ...
+    early_stopping.close()  # 训练结束后调用，保证最优模型已经写入磁盘
+
+    内存中保存最优模型：前期几乎每个 epoch 都会变好，每次都写文件代价太大
+    early_stopping = EarlyStopping(patience, keep_best_in_memory=True,
+                                   save_every=10, min_save_interval=60)  # 距离上次写入已满 10 个 epoch 或者 60 秒时，把更好的模型写入磁盘
+    ...
+    early_stopping.close()  # 将内存中的最优模型写入磁盘
+    early_stopping.restore_best(model)  # 直接从内存恢复最优参数，不需要再读文件
 '''
 
 
+def _writer_loop(work_queue, errors, trace_func):
+    # 后台线程只引用队列和错误列表，不引用 AsyncCheckpointWriter 本身，writer 不再使用时可以被回收
+    while True:
+        item = work_queue.get()
+        try:
+            if item is None:
+                return
+            obj, path, save_func = item
+            save_func(obj, path)
+        except Exception as e:  # 记录异常，在训练线程中下一次调用时抛出
+            errors.append(e)
+            trace_func(f'AsyncCheckpointWriter failed to save checkpoint: {e!r}')
+        finally:
+            work_queue.task_done()
+
+
+def _stop_writer(work_queue, thread):
+    # 写完队列中剩余的 checkpoint 后结束后台线程
+    work_queue.put(None)
+    thread.join()
+
+
+class AsyncCheckpointWriter:
+    """Writes checkpoints on a background thread so that the training loop does not wait for disk I/O."""
+
+    def __init__(self, max_queue_size=2, trace_func=print):
+        """
+        Args:
+            max_queue_size (int): Maximum number of pending checkpoints. When the queue is full,
+                            submit blocks until the writer catches up.
+                            Default: 2
+            trace_func (function): trace print function.
+                            Default: print
+        """
+        self.trace_func = trace_func
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._errors = []
+        self._closed = False
+        self._thread = threading.Thread(target=_writer_loop, args=(self._queue, self._errors, trace_func),
+                                        name='AsyncCheckpointWriter', daemon=True)
+        self._thread.start()
+        # 没有调用 close 时，writer 被回收或者进程退出时都会写完剩余的 checkpoint；
+        # finalize 只持有队列和线程，不会让 writer（以及 EarlyStopping 和它引用的模型）一直存活到进程退出
+        self._finalizer = weakref.finalize(self, _stop_writer, self._queue, self._thread)
+
+    def _raise_error(self):
+        if self._errors:
+            error = self._errors[-1]
+            self._errors.clear()
+            raise RuntimeError('Background checkpoint write failed') from error
+
+    def submit(self, obj, path, save_func=atomic_save):
+        """Queues obj to be saved to path with save_func(obj, path). obj must not be modified afterwards."""
+        if self._closed:
+            raise RuntimeError('AsyncCheckpointWriter is closed')
+        self._raise_error()
+        self._queue.put((obj, path, save_func))
+
+    def flush(self):
+        """Blocks until every queued checkpoint has been written."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Writes the pending checkpoints and stops the background thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._finalizer()
+        self._raise_error()
+
+
 class EarlyStopping:
     """Early stops the training if validation loss doesn't improve after a given patience."""
 
-    def __init__(self, patience=7, verbose=False, delta=0, path='checkpoint.pt', trace_func=print):
+    def __init__(self, patience=7, verbose=False, delta=0, path='checkpoint.pt', trace_func=print,
+                 async_save=False, max_queue_size=2, keep_best_in_memory=False, save_every=None,
+                 min_save_interval=None, min_save_improvement=None, incremental=False, codec=None, dtype=None,
+                 trial=None):
         """
         Args:
             patience (int): How long to wait after last time validation loss improved.
@@ -39,19 +134,66 @@ class EarlyStopping:
                             Default: 'checkpoint.pt'
             trace_func (function): trace print function.
                             Default: print            
+            async_save (bool): If True, checkpoints are copied to CPU and written by a background thread.
+                            Call flush() or close() before reading the checkpoint file.
+                            Default: False
+            max_queue_size (int): Maximum number of checkpoints waiting to be written in async mode.
+                            Default: 2
+            keep_best_in_memory (bool): If True, the best weights are kept as a CPU copy and only written
+                            to disk according to the policy below, when early stopping triggers,
+                            and on save_best()/close().
+                            Default: False
+            save_every (int): In memory mode, write an improved best as soon as at least N epochs
+                            passed since the last write. Any of the three conditions triggers a write.
+                            Default: None
+            min_save_interval (float): In memory mode, write an improved best as soon as at least T seconds
+                            passed since the last write.
+                            Default: None
+            min_save_improvement (float): In memory mode, write the best weights if the validation loss
+                            improved by more than this amount since the last write.
+                            Default: None
+            incremental (bool): If True, path is a DeltaCheckpointStore directory and each save only writes
+                            the tensors that changed since the previous save.
+                            Default: False
+            codec (str): Compression codec for the checkpoint file ('auto', 'zstd', 'lz4', 'zlib' or 'none').
+                            Load it with utils.load_model, which decompresses transparently.
+                            Default: None
+            dtype (str): Store floating tensors as 'fp16' or 'bf16'. They are upcast again on load.
+                            Default: None
+            trial (sweep.Trial): Reports each validation loss to an ASHA sweep and stops early when the
+                            sweep prunes this run. Picked up automatically inside run_sweep(asha=...).
+                            Default: None
         """
+        from .sweep import current_trial
+
         self.patience = patience
         self.verbose = verbose
         self.counter = 0
         self.best_score = None
         self.early_stop = False
-        self.val_loss_min = np.Inf
+        self.val_loss_min = np.inf
         self.delta = delta
         self.path = path
         self.trace_func = trace_func
+        self.writer = AsyncCheckpointWriter(max_queue_size, trace_func) if async_save else None
+        self.store = DeltaCheckpointStore(path) if incremental else None
+        self.save_func = get_save_func(codec, dtype)
+        self.keep_best_in_memory = keep_best_in_memory
+        self.save_every = save_every
+        self.min_save_interval = min_save_interval
+        self.min_save_improvement = min_save_improvement
+        self.epoch = 0
+        self.best_epoch = 0
+        self.best_state = None
+        self.saved_val_loss = np.inf  # 已经写入磁盘的最优 loss
+        self.saved_epoch = 0  # 已经写入磁盘的最优模型来自哪个 epoch
+        self.last_save_epoch = 0
+        self.last_save_time = time.time()
+        self.trial = trial if trial is not None else current_trial()
 
     def __call__(self, val_loss, model):
 
+        self.epoch += 1
         score = -val_loss
 
         if self.best_score is None:
@@ -62,15 +204,115 @@ class EarlyStopping:
             self.trace_func(f'EarlyStopping counter: {self.counter} out of {self.patience}')
             if self.counter >= self.patience:
                 self.early_stop = True
+                if self.keep_best_in_memory:
+                    self.save_best()
         else:
             self.best_score = score
             self.save_checkpoint(val_loss, model)
             self.counter = 0
 
+        if self.trial is not None and not self.early_stop:
+            # 没有指定 metric 时用验证集 loss 参与比较，否则由 Logger.log_metric 报告
+            if self.trial.metric is None:
+                self.trial.report_score(self.epoch, score)
+            if self.trial.should_stop:
+                self.trace_func(f'Stopped by the sweep scheduler at epoch {self.epoch}')
+                self.early_stop = True
+                if self.keep_best_in_memory:
+                    self.save_best()
+
     def save_checkpoint(self, val_loss, model):
         """Saves model when validation loss decrease."""
+        if self.keep_best_in_memory:
+            if self.verbose:
+                self.trace_func(f'Validation loss decreased ({self.val_loss_min:.6f} --> {val_loss:.6f}).  '
+                                f'Keeping model in memory ...')
+            self.best_state = state_dict_to_cpu(model)
+            self.best_epoch = self.epoch
+            self.val_loss_min = val_loss
+            if self._should_write():
+                self.save_best()
+            return
+
         if self.verbose:
             self.trace_func(
                 f'Validation loss decreased ({self.val_loss_min:.6f} --> {val_loss:.6f}).  Saving model ...')
-        torch.save(model.state_dict(), self.path)
+        self.best_epoch = self.epoch
+        if self.writer is not None:
+            self._write(state_dict_to_cpu(model))
+        elif self.store is not None or self.save_func is not atomic_save:
+            self._write(model.state_dict())
+        else:
+            torch.save(model.state_dict(), self.path)
         self.val_loss_min = val_loss
+
+    def _write(self, state_dict):
+        """Writes state_dict to self.path, through the background writer and the delta store if enabled."""
+        if self.store is not None:
+            tag = f'epoch_{self.best_epoch}'
+
+            def save_func(obj, path):
+                self.store.save(obj, tag=tag)
+        else:
+            save_func = self.save_func
+        if self.writer is not None:
+            self.writer.submit(state_dict, self.path, save_func)
+        else:
+            save_func(state_dict, self.path)
+
+    def _should_write(self):
+        """Decides whether the in-memory best weights should be written to disk now."""
+        if self.save_every is not None and self.epoch - self.last_save_epoch >= self.save_every:
+            return True
+        if self.min_save_interval is not None and time.time() - self.last_save_time >= self.min_save_interval:
+            return True
+        if self.min_save_improvement is not None and \
+                self.saved_val_loss - self.val_loss_min > self.min_save_improvement:
+            return True
+        return False
+
+    def save_best(self):
+        """Writes the in-memory best weights to disk if they have not been written yet."""
+        # 按 epoch 判断而不是比较 loss：delta=0 时与最优 loss 相等的 epoch 也会替换 best_state
+        if self.best_state is None or self.best_epoch == self.saved_epoch:
+            return
+        if self.verbose:
+            self.trace_func(f'Saving best model of epoch {self.best_epoch} (val loss {self.val_loss_min:.6f}) ...')
+        # best_state 在下一次变好时会被整体替换而不是原地修改，可以直接交给后台线程
+        self._write(self.best_state)
+        self.saved_val_loss = self.val_loss_min
+        self.saved_epoch = self.best_epoch
+        self.last_save_epoch = self.epoch
+        self.last_save_time = time.time()
+
+    def restore_best(self, model):
+        """Loads the in-memory best weights into model without reading the checkpoint file."""
+        if self.best_state is None:
+            raise RuntimeError('No best weights in memory, construct EarlyStopping with keep_best_in_memory=True')
+        model.load_state_dict(self.best_state)
+        return model
+
+    def state_dict(self):
+        """Returns the counters, best score and in-memory best weights needed to resume training exactly."""
+        return {'counter': self.counter, 'best_score': self.best_score, 'early_stop': self.early_stop,
+                'val_loss_min': self.val_loss_min, 'epoch': self.epoch, 'best_epoch': self.best_epoch,
+                'best_state': self.best_state, 'saved_val_loss': self.saved_val_loss,
+                'saved_epoch': self.saved_epoch, 'last_save_epoch': self.last_save_epoch}
+
+    def load_state_dict(self, state_dict):
+        """Restores the state returned by state_dict. The save interval timer restarts from now."""
+        for key, value in state_dict.items():
+            setattr(self, key, value)
+        self.last_save_time = time.time()
+
+    def flush(self):
+        """Blocks until the latest checkpoint is on disk. No-op in synchronous mode."""
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self):
+        """Writes the in-memory best weights, flushes pending checkpoints and stops the background writer."""
+        if self.keep_best_in_memory:
+            self.save_best()
+        if self.writer is not None:
+            self.writer.close()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# 用法：
+'''
+    results = evaluate_embedding(embedding, labels, edges=test_edges, neg_edges=test_neg_edges,
+                                 save_dir=os.path.join(exp_folder, 'fig'))
+    logger.save_metric(results)  # 或者每个 epoch 调用 logger.log_metric(results)
+'''
+
+TASKS = ('classification', 'clustering', 'link_prediction', 'tsne')
+
+
+class SharedArray:
+    """numpy array stored in a named shared-memory block that worker processes attach to without copying."""
+
+    def __init__(self, array):
+        """
+        :param array: 需要共享的数组，只在这里复制一次
+        """
+        array = np.ascontiguousarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)[...] = array
+
+    def descriptor(self) -> tuple:
+        """传给工作进程的描述 (name, shape, dtype)，只有几十个字节"""
+        return self._shm.name, self.shape, self.dtype
+
+    def close(self) -> None:
+        self._shm.close()
+        self._shm.unlink()
+
+
+def attach(descriptor):
+    """
+    在工作进程中按描述打开共享内存
+    :param descriptor: SharedArray.descriptor() 的返回值，为 None 时返回 (None, None)
+    :return: (只读的 numpy 数组, SharedMemory)，用完之后需要调用 SharedMemory.close()
+    """
+    if descriptor is None:
+        return None, None
+    name, shape, dtype = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    array.flags.writeable = False
+    return array, shm
+
+
+def classification_task(x, labels, label_ratios=(0.3,), seeds=range(10), classifier='logistic', **kwargs):
+    """节点分类，结果为各个测试比例上 F1 的均值"""
+    from .ml import evaluate_classification
+
+    results = evaluate_classification(x, labels, label_ratios=label_ratios, seeds=seeds, classifier=classifier,
+                                      num_workers=1, **kwargs)
+    metric = {}
+    for ratio, scores in results.items():
+        suffix = '' if len(results) == 1 else f'@{ratio}'
+        metric[f'Cls Micro-F1{suffix}'] = scores['micro'][0]
+        metric[f'Cls Macro-F1{suffix}'] = scores['macro'][0]
+    return metric
+
+
+def clustering_task(x, labels, n_clusters=None, seed=0):
+    """k-means 聚类，与标签比较 NMI 和 ARI"""
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score
+
+    from .ml import as_class_labels
+
+    labels = as_class_labels(labels)
+    if n_clusters is None:
+        n_clusters = len(np.unique(labels))
+    pred = KMeans(n_clusters=n_clusters, n_init=10, random_state=seed).fit_predict(x)
+    return {'NMI': normalized_mutual_info_score(labels, pred), 'ARI': adjusted_rand_score(labels, pred)}
+
+
+def as_edge_list(edges):
+    """把 [2, E]（edge_index 格式）或者 [E, 2] 的边统一为 [E, 2]"""
+    if edges.shape[0] == 2 and edges.shape[1] != 2:
+        return edges.T
+    return edges
+
+
+def link_prediction_task(x, edges, neg_edges):
+    """用嵌入内积对正负边打分，计算 AUC 和 AP"""
+    from sklearn.metrics import average_precision_score, roc_auc_score
+
+    edges = as_edge_list(edges)
+    neg_edges = as_edge_list(neg_edges)
+    scores = np.concatenate([np.einsum('ij,ij->i', x[edges[:, 0]], x[edges[:, 1]]),
+                             np.einsum('ij,ij->i', x[neg_edges[:, 0]], x[neg_edges[:, 1]])])
+    target = np.concatenate([np.ones(len(edges)), np.zeros(len(neg_edges))])
+    return {'LP AUC': roc_auc_score(target, scores), 'LP AP': average_precision_score(target, scores)}
+
+
+def tsne_task(x, labels, save_dir='.', file_name='tsne.pdf', **kwargs):
+    """t-SNE 可视化，图保存到 save_dir/file_name，不产生指标"""
+    import matplotlib.pyplot as plt
+
+    from .visual_embedding import plot_embeddings
+
+    os.makedirs(save_dir, exist_ok=True)
+    plt.figure()
+    plot_embeddings(x, labels=labels, show=False, **kwargs)
+    plt.savefig(os.path.join(save_dir, file_name), bbox_inches='tight', dpi=300)
+    plt.close()
+    return {}
+
+
+TASK_FUNCS = {
+    'classification': (classification_task, ('x', 'labels')),
+    'clustering': (clustering_task, ('x', 'labels')),
+    'link_prediction': (link_prediction_task, ('x', 'edges', 'neg_edges')),
+    'tsne': (tsne_task, ('x', 'labels')),
+}
+
+
+def _call_task(task, arrays, kwargs):
+    func, inputs = TASK_FUNCS[task]
+    start = time.perf_counter()
+    metric = func(*(arrays.get(key) for key in inputs), **kwargs)
+    return task, metric, time.perf_counter() - start
+
+
+def _run_task(item):
+    task, descriptors, kwargs = item
+    arrays, handles = {}, []
+    try:
+        for key in TASK_FUNCS[task][1]:
+            arrays[key], shm = attach(descriptors.get(key))
+            if shm is not None:
+                handles.append(shm)
+        return _call_task(task, arrays, kwargs)
+    finally:
+        arrays.clear()  # 先释放数组视图，否则 SharedMemory.close() 会因为缓冲区仍被引用而报错
+        for shm in handles:
+            shm.close()
+
+
+def evaluate_embedding(embedding, labels=None, edges=None, neg_edges=None, tasks=None, save_dir=None,
+                       num_workers=None, task_kwargs=None, verbose=False) -> dict:
+    """
+    把嵌入放入共享内存，在多个进程中同时运行下游任务，总耗时约等于最慢的任务
+    :param embedding: [N, D] 的嵌入，numpy 数组或者 torch.Tensor
+    :param labels: [N]、[N, 1] 或者 one-hot 的 [N, C] 标签，分类、聚类和 t-SNE 使用
+    :param edges: [E, 2] 或者 [2, E] 的测试正边，链路预测使用
+    :param neg_edges: 测试负边，格式同 edges
+    :param tasks: 需要运行的任务，默认为输入数据支持的所有任务（链路预测需要同时给出 edges 和 neg_edges），见 TASKS
+    :param save_dir: t-SNE 图的保存目录，为 None 时不画 t-SNE
+    :param num_workers: 进程数，为 None 时每个任务一个进程，为 1 时在当前进程中依次运行
+    :param task_kwargs: 任务名 -> 额外参数，例如 {'classification': {'label_ratios': (0.1, 0.3)}}
+    :param verbose: 是否打印每个任务的耗时
+    :return: 指标名 -> 数值，可以直接传给 Logger.log_metric 或 Logger.save_metric
+    """
+    from .ml import preprocess_embedding
+    from .visual_embedding import to_numpy
+
+    if tasks is None:
+        tasks = [task for task in TASKS
+                 if (task != 'link_prediction' or (edges is not None and neg_edges is not None))
+                 and (task == 'link_prediction' or labels is not None)
+                 and (task != 'tsne' or save_dir is not None)]
+    # 在启动进程池之前检查输入，避免某个任务在工作进程中失败导致整个评估中断
+    unknown = [task for task in tasks if task not in TASK_FUNCS]
+    if unknown:
+        raise ValueError(f'unknown tasks {unknown}, expected a subset of {TASKS}')
+    if 'link_prediction' in tasks and (edges is None or neg_edges is None):
+        raise ValueError('link_prediction requires both edges and neg_edges')
+    missing_labels = [task for task in tasks if task != 'link_prediction' and labels is None]
+    if missing_labels:
+        raise ValueError(f'{missing_labels} require labels')
+    task_kwargs = dict(task_kwargs or {})
+    if 'tsne' in tasks and save_dir is not None:
+        task_kwargs.setdefault('tsne', {}).setdefault('save_dir', save_dir)
+
+    inputs = {'x': preprocess_embedding(embedding, normalize=None)}
+    if labels is not None:
+        inputs['labels'] = to_numpy(labels)
+    for key, value in (('edges', edges), ('neg_edges', neg_edges)):
+        if value is not None:
+            inputs[key] = to_numpy(value)
+
+    if num_workers is None:
+        num_workers = len(tasks)
+    num_workers = min(num_workers, len(tasks))
+    if num_workers <= 1:
+        outputs = [_call_task(task, inputs, task_kwargs.get(task, {})) for task in tasks]
+    else:
+        shared = {key: SharedArray(value) for key, value in inputs.items()}
+        try:
+            descriptors = {key: array.descriptor() for key, array in shared.items()}
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                outputs = list(executor.map(_run_task, [(task, descriptors, task_kwargs.get(task, {}))
+                                                        for task in tasks]))
+        finally:
+            for array in shared.values():
+                array.close()
+
+    results = {}
+    for task, metric, elapsed in outputs:
+        if verbose:
+            print(f'{task}: {elapsed:.2f}s')
+        results.update({key: float(value) for key, value in metric.items()})
+    return results
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import importlib
+
+
+class LazyModule:
+    """Module proxy that imports the real module on first attribute access."""
+
+    def __init__(self, name: str):
+        """
+        :param name: 模块名，例如 'torch'、'matplotlib.pyplot'
+        """
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # 只有实例上不存在的属性才会走到这里，_name 和 _module 不会触发导入
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    延迟导入，torch、matplotlib 等较重的依赖在第一次使用时才会被导入，只用到 mkdir 等轻量函数时不需要付出导入的代价
+    :param name: 模块名
+    :return: 模块代理
+    """
+    return LazyModule(name)
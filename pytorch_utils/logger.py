@@ -2,40 +2,165 @@
 # @Time    : 2023/11/21
 # @Author  : Zhong Zhijie
 
-import logging
+import json
 import os
-import sys
-import numpy as np
-from utils import print_config_summary
+from collections import defaultdict
+
+from .lazy import lazy_import
+from .utils import get_logger, print_config_summary
+
+np = lazy_import('numpy')
+
+
+def is_loss(key):
+    # 名字中带 loss 的指标越小越好，其余指标越大越好
+    return 'loss' in key.lower()
+
+
+def format_best_metric(key, epoch, value):
+    if is_loss(key):
+        return 'At the {}th epoch, the minimum {} is {}.'.format(epoch, key.lower(), value)
+    return 'At the {}th epoch, the maximum {} is {}.'.format(epoch, key.lower(), value)
+
+
+def write_best_metric(best_metric_log_path, index_values):
+    # 找到最长的键的长度
+    max_key_length = max(len(k) for k in index_values.keys())
+    with open(best_metric_log_path, 'w') as f:
+        for k, v in index_values.items():
+            # 将 k 右对齐并占用最长键的长度
+            formatted_key = f"{k:>{max_key_length}}"
+            f.write(f"{formatted_key}: {v}\n")
+
+
+class MetricStream:
+    def __init__(self, save_dir, file_name='3.metric.jsonl', flush_every=1):
+        """
+        逐个 epoch 追加写入指标，并增量维护每个指标的最优值，训练中断时已经写入的指标不会丢失
+        :param save_dir: 日志保存的目录
+        :param file_name: 指标流的文件名，每行是一个 epoch 的 json
+        :param flush_every: 每多少个 epoch 写一次磁盘
+        """
+        self.path = os.path.join(save_dir, file_name)
+        self.save_dir = save_dir
+        self.flush_every = flush_every
+        self.history = defaultdict(list)
+        self.best = {}  # 指标名 -> (epoch, 最优值)
+        self.epoch = 0
+        self._buffer = []
+        # 文件已经存在时（例如恢复训练），先读入之前的指标
+        if os.path.exists(self.path):
+            self._load()
+        self._file = open(self.path, 'a', encoding='utf8')
+
+    def _load(self, size=None):
+        """
+        读入文件中已有的指标，写入时中断留下的不完整的最后一行会被截掉，之后追加的行不会与它拼在一起
+        :param size: 不为 None 时先把文件截断到 size 字节
+        """
+        with open(self.path, 'rb+') as f:
+            if size is not None:
+                f.truncate(size)
+            offset = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        break
+                    self._update(row)
+                offset += len(line)
+            f.truncate(offset)
+
+    def _update(self, row):
+        self.epoch = row.pop('epoch')
+        for key, value in row.items():
+            self.history[key].append(value)
+            best = self.best.get(key)
+            if best is None or (value < best[1] if is_loss(key) else value > best[1]):
+                self.best[key] = (self.epoch, value)
+
+    def append(self, metrics: dict):
+        """
+        追加一个 epoch 的指标
+        :param metrics: 指标名 -> 数值
+        """
+        row = {'epoch': self.epoch + 1}
+        row.update((k, float(v)) for k, v in metrics.items())
+        self._buffer.append(json.dumps(row))
+        self._update(row)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """将缓冲的指标写入磁盘，并更新 4.best_metric.log"""
+        if self._buffer:
+            self._file.write('\n'.join(self._buffer) + '\n')
+            self._file.flush()
+            self._buffer = []
+        if self.best:
+            self.save_best_metric()
+
+    def save_best_metric(self):
+        # 最优值是增量维护的，不需要重新扫描所有 epoch
+        index_values = {k: format_best_metric(k, epoch, value) for k, (epoch, value) in self.best.items()}
+        write_best_metric(os.path.join(self.save_dir, '4.best_metric.log'), index_values)
+
+    def save_metric(self):
+        # 与 Logger.save_metric 的格式一致，每一行是一个指标在所有 epoch 上的值
+        np.savetxt(os.path.join(self.save_dir, '3.metric.log'), np.array([v for v in self.history.values()]),
+                   delimiter=',', fmt='%f')
+
+    def state_dict(self) -> dict:
+        """
+        先把缓冲的指标写入磁盘，记录当前的 epoch 和文件长度
+        :return: {'epoch', 'offset'}
+        """
+        self.flush()
+        return {'epoch': self.epoch, 'offset': self._file.tell()}
+
+    def load_state_dict(self, state: dict):
+        """
+        回到 state_dict 时的状态：截掉之后追加的指标（例如中断前最后一次保存之后的 epoch），重新读入历史和最优值
+        :param state: state_dict 的返回值
+        """
+        self._file.close()
+        self._buffer = []
+        self.history = defaultdict(list)
+        self.best = {}
+        self.epoch = 0
+        self._load(state['offset'])
+        if self.epoch != state['epoch']:
+            raise RuntimeError(f'{self.path} ends at epoch {self.epoch}, expected epoch {state["epoch"]}')
+        self._file = open(self.path, 'a', encoding='utf8')
+        if self.best:
+            self.save_best_metric()
+
+    def close(self):
+        self.flush()
+        self.save_metric()
+        self._file.close()
 
 
 class Logger:
-    def __init__(self, save_dir, file_name='5.train.log', name='train'):
+    def __init__(self, save_dir, file_name='5.train.log', name='train', registry=None):
         """
         :param name: logger名称
         :param save_dir: 日志保存的目录
         :param file_name: 日志保存的文件名
+        :param registry: 可选的 ExperimentRegistry，参数和指标会同时写入数据库
         """
         self.name = name
         self.save_dir = save_dir
         self.file_name = file_name
+        self.registry = registry
+        self.metric_stream = None
 
-    def get_logger(self):
-        logger = logging.getLogger(self.name)
-        logger.setLevel(logging.INFO)
-
-        ch = logging.StreamHandler(stream=sys.stdout)
-        ch.setLevel(logging.INFO)
-        formatter = logging.Formatter("%(asctime)s %(name)s %(levelname)s: %(message)s", datefmt='%Y/%m/%d %I:%M:%S')
-        ch.setFormatter(formatter)
-        logger.addHandler(ch)
-
-        if self.save_dir:
-            fh = logging.FileHandler(os.path.join(self.save_dir, self.file_name))
-            fh.setLevel(logging.INFO)
-            fh.setFormatter(formatter)
-            logger.addHandler(fh)
-        return logger
+    def get_logger(self, use_queue=True):
+        # 重复调用不会重复添加 handler；默认在后台线程中写日志，不占用训练时间
+        return get_logger(self.name, self.save_dir, self.file_name, use_queue=use_queue)
 
     def save_model_structure(self, model):
         # 保存模型的结构，方便以后查看对应使用的模型
@@ -50,32 +175,74 @@ class Logger:
         with open(parameter_log_path, 'w', encoding='utf8') as f:
             f.write(args_draw)
         f.close()
+        if self.registry is not None:
+            self.registry.log_params(self.save_dir, args)
 
     def save_metric(self, metric: dict):
         metric_log_path = os.path.join(self.save_dir, '3.metric.log')
         best_metric_log_path = os.path.join(self.save_dir, '4.best_metric.log')
+        # 单个数值（例如 evaluate_embedding 的结果）当作只有一个 epoch 的列表
+        metric = {key: list(values) if isinstance(values, (list, tuple, np.ndarray)) else [values]
+                  for key, values in metric.items()}
         # 将字典中的值列表转换为 NumPy 数组
         array_metric = np.array([v for v in metric.values()])
         # 保存 NumPy 数组到文本文件
         np.savetxt(metric_log_path, array_metric, delimiter=',', fmt='%f')
 
         index_values = {}
+        best = {}
         for key, values in metric.items():
-            if 'loss' in key.lower():
-                min_index = values.index(min(values)) + 1
-                index_values[key] = 'At the {}th epoch, the minimum {} is {}.'.format(min_index, key.lower(),
-                                                                                      min(values))
-            else:
-                max_index = values.index(max(values)) + 1
-                index_values[key] = max_index
-                index_values[key] = 'At the {}th epoch, the maximum {} is {}.'.format(max_index, key.lower(),
-                                                                                      max(values))
-
-        # 找到最长的键的长度
-        max_key_length = max(len(k) for k in index_values.keys())
-        with open(best_metric_log_path, 'w') as f:
-            for k, v in index_values.items():
-                # 将 k 右对齐并占用最长键的长度
-                formatted_key = f"{k:>{max_key_length}}"
-                f.write(f"{formatted_key}: {v}\n")
-        f.close()
+            best_value = min(values) if is_loss(key) else max(values)
+            best[key] = (values.index(best_value) + 1, best_value, 'min' if is_loss(key) else 'max')
+            index_values[key] = format_best_metric(key, best[key][0], best_value)
+        write_best_metric(best_metric_log_path, index_values)
+
+        if self.registry is not None:
+            self.registry.log_metrics(self.save_dir, metric)
+            self.registry.log_best(self.save_dir, best)
+
+    def log_metric(self, metric: dict, flush_every=1):
+        """
+        每个 epoch 调用一次，追加写入 3.metric.jsonl 并更新 4.best_metric.log
+        在 run_sweep(asha=ASHA(metric=...)) 中运行时同时向 ASHA 报告该指标
+        训练结束后调用 close_metric 生成 3.metric.log
+        :param metric: 当前 epoch 的指标，指标名 -> 数值
+        :param flush_every: 每多少个 epoch 写一次磁盘
+        :return: 被 ASHA 淘汰时返回 True，训练循环应该退出；不在 sweep 中时总是 False
+        """
+        if self.metric_stream is None:
+            self.metric_stream = MetricStream(self.save_dir, flush_every=flush_every)
+        from .sweep import current_trial
+
+        self.metric_stream.append(metric)
+        trial = current_trial()
+        if trial is not None and trial.metric in metric:
+            trial.report(self.metric_stream.epoch, metric[trial.metric])
+        if self.registry is not None:
+            self.registry.log_epoch(self.save_dir, self.metric_stream.epoch, metric)
+        return trial is not None and trial.should_stop
+
+    def state_dict(self) -> dict:
+        """log_metric 写入的指标的状态，TrainingState 保存到断点中"""
+        return {'metric_stream': None if self.metric_stream is None else self.metric_stream.state_dict()}
+
+    def load_state_dict(self, state: dict, flush_every=1):
+        """
+        恢复训练时调用，3.metric.jsonl 截断到保存断点时的 epoch
+        :param state: state_dict 的返回值
+        :param flush_every: 与 log_metric 的参数相同
+        """
+        if state['metric_stream'] is None:
+            return
+        if self.metric_stream is None:
+            self.metric_stream = MetricStream(self.save_dir, flush_every=flush_every)
+        self.metric_stream.load_state_dict(state['metric_stream'])
+
+    def close_metric(self):
+        if self.metric_stream is not None:
+            self.metric_stream.close()
+            if self.registry is not None:
+                self.registry.log_best(self.save_dir, {k: (epoch, value, 'min' if is_loss(k) else 'max')
+                                                       for k, (epoch, value) in self.metric_stream.best.items()})
+                self.registry.flush()
+            self.metric_stream = None
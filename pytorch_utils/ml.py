@@ -2,10 +2,23 @@
 # @Time    : 2023/12/21
 # @Author  : Zhong Zhijie
 
-from sklearn import svm
-from sklearn.decomposition import PCA
-from sklearn.metrics import f1_score
-from sklearn.model_selection import train_test_split
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# 用法：
+'''
+    # 10 个随机种子 × 5 个测试比例，逻辑回归，结果为均值和标准差
+    results = evaluate_classification(embedding, labels, label_ratios=(0.1, 0.3, 0.5, 0.7, 0.9), seeds=range(10))
+    print(results[0.3]['weighted'])  # (mean, std)
+'''
+
+F1_AVERAGES = ('micro', 'macro', 'weighted')
+
+_shared = {}  # 工作进程中的嵌入和标签，由 _init_worker 设置，每个进程只传输一次
 
 
 def svm4cls(embedding, labels, label_ratio=0.3):
@@ -16,8 +29,13 @@ def svm4cls(embedding, labels, label_ratio=0.3):
     :param label_ratio: 测试的比例
     :return: F1分数
     """
+    from sklearn import svm
+    from sklearn.metrics import f1_score
+    from sklearn.model_selection import train_test_split
+
     X_train, X_test, Y_train, Y_test = train_test_split(embedding, labels, test_size=label_ratio, random_state=42)
-    clf = svm.SVC(probability=True)
+    # predict 不使用概率，probability=True 只会多做一次 5 折交叉验证
+    clf = svm.SVC()
     clf.fit(X_train, Y_train)
 
     Pred_Y = clf.predict(X_test)
@@ -25,9 +43,267 @@ def svm4cls(embedding, labels, label_ratio=0.3):
     return score
 
 
-def pca2embedding(matrix, pca_dim=128):
-    pca = PCA(n_components=pca_dim)
-    pca_matrix = pca.fit_transform(matrix)
-    return pca_matrix
+def as_class_labels(labels):
+    """把 [N]、[N, 1] 或者 one-hot 的 [N, C] 标签转换为 [N] 的类别数组"""
+    from .visual_embedding import to_numpy
+
+    labels = to_numpy(labels)
+    if labels.ndim > 1:
+        labels = labels[:, 0] if labels.shape[1] == 1 else labels.argmax(axis=1)
+    return labels
+
+
+def preprocess_embedding(embedding, normalize='l2'):
+    """
+    对嵌入做一次预处理，所有划分和随机种子共用
+    :param embedding: [N, D] 的嵌入
+    :param normalize: 'l2' 按行归一化，'standard' 按列标准化（只用到嵌入本身，不用标签），None 不处理
+    :return: [N, D] 的 float32 数组
+    """
+    from .visual_embedding import to_numpy
+
+    x = to_numpy(embedding).astype(np.float32, copy=False)
+    if normalize == 'l2':
+        x = x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+    elif normalize == 'standard':
+        x = (x - x.mean(axis=0)) / np.maximum(x.std(axis=0), 1e-12)
+    elif normalize is not None:
+        raise ValueError(f'unknown normalization {normalize!r}')
+    return x
+
+
+def make_classifier(name: str, seed: int = 0):
+    """
+    :param name: 'logistic' 逻辑回归，'linear' 线性 SVM，'svm' RBF 核 SVM（与 svm4cls 相同，点数多时很慢）
+    :param seed: 随机种子
+    :return: sklearn 分类器
+    """
+    if name == 'logistic':
+        from sklearn.linear_model import LogisticRegression
+        return LogisticRegression(max_iter=1000, random_state=seed)
+    if name == 'linear':
+        from sklearn.svm import LinearSVC
+        return LinearSVC(random_state=seed)
+    if name == 'svm':
+        from sklearn.svm import SVC
+        return SVC(random_state=seed)
+    raise ValueError(f'unknown classifier {name!r}')
+
+
+def make_splits(n: int, label_ratios, seeds) -> list:
+    """
+    预先生成所有 (测试比例, 随机种子) 的划分，不同的分类器可以复用同一组划分
+    :param n: 节点数
+    :param label_ratios: 测试比例列表
+    :param seeds: 随机种子列表
+    :return: [(label_ratio, seed, train_index, test_index), ...]
+    """
+    splits = []
+    for ratio in label_ratios:
+        n_test = min(max(int(round(n * ratio)), 1), n - 1)
+        for seed in seeds:
+            perm = np.random.default_rng(seed).permutation(n)
+            splits.append((ratio, seed, np.sort(perm[n_test:]), np.sort(perm[:n_test])))
+    return splits
+
+
+def _init_worker(embedding, labels):
+    from threadpoolctl import threadpool_limits
+
+    # 并行度由进程数提供，每个进程内的 BLAS 只用一个线程，避免线程数超过 CPU 核数
+    threadpool_limits(1)
+    _shared['embedding'] = embedding
+    _shared['labels'] = labels
+
+
+def _evaluate_split(task):
+    from sklearn.metrics import f1_score
+
+    classifier, ratio, seed, train_index, test_index = task
+    x, y = _shared['embedding'], _shared['labels']
+    clf = make_classifier(classifier, seed)
+    clf.fit(x[train_index], y[train_index])
+    pred = clf.predict(x[test_index])
+    return ratio, seed, {average: f1_score(y[test_index], pred, average=average) for average in F1_AVERAGES}
+
+
+def evaluate_classification(embedding, labels, label_ratios=(0.3,), seeds=range(10), classifier='logistic',
+                            normalize='l2', num_workers=None, splits=None, return_runs=False):
+    """
+    在多个测试比例和随机种子上评估嵌入的节点分类效果
+    :param embedding: [N, D] 的嵌入，numpy 数组或者 torch.Tensor
+    :param labels: [N]、[N, 1] 或者 one-hot 的 [N, C] 标签
+    :param label_ratios: 测试比例列表，与 svm4cls 的 label_ratio 含义相同
+    :param seeds: 随机种子列表
+    :param classifier: 'logistic'、'linear' 或者 'svm'，见 make_classifier
+    :param normalize: 预处理方式，见 preprocess_embedding
+    :param num_workers: 进程数，为 None 时使用 CPU 核数，为 1 时在当前进程中依次计算
+    :param splits: make_splits 的返回值，为 None 时由 label_ratios 和 seeds 生成
+    :param return_runs: 是否同时返回每次划分的 F1
+    :return: {label_ratio: {'micro': (mean, std), 'macro': (mean, std), 'weighted': (mean, std)}}，
+             return_runs=True 时返回 (结果, [(label_ratio, seed, {average: f1}), ...])
+    """
+    x = preprocess_embedding(embedding, normalize)
+    y = as_class_labels(labels)
+    if splits is None:
+        splits = make_splits(x.shape[0], label_ratios, list(seeds))
+    tasks = [(classifier, ratio, seed, train_index, test_index) for ratio, seed, train_index, test_index in splits]
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = min(num_workers, len(tasks))
+    if num_workers > 1:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(x, y)) as executor:
+            runs = list(executor.map(_evaluate_split, tasks))
+    else:
+        _shared['embedding'], _shared['labels'] = x, y
+        try:
+            runs = [_evaluate_split(task) for task in tasks]
+        finally:
+            _shared.clear()
+
+    scores = {}
+    for ratio, _, f1 in runs:
+        for average, value in f1.items():
+            scores.setdefault(ratio, {}).setdefault(average, []).append(value)
+    results = {ratio: {average: (float(np.mean(values)), float(np.std(values))) for average, values in by_avg.items()}
+               for ratio, by_avg in scores.items()}
+    if return_runs:
+        return results, runs
+    return results
+
+
+def load_matrix(matrix):
+    """
+    :param matrix: numpy 数组、np.memmap、.npy 文件路径（以只读 mmap 打开，不读入内存）或者 scipy 稀疏矩阵
+    :return: 可以按行切片的矩阵，稀疏矩阵转换为 CSR
+    """
+    if isinstance(matrix, (str, os.PathLike)):
+        return np.load(matrix, mmap_mode='r')
+    if hasattr(matrix, 'tocsr'):  # scipy.sparse
+        return matrix.tocsr()
+    if hasattr(matrix, 'detach') and hasattr(matrix, 'cpu'):  # torch.Tensor
+        from .visual_embedding import to_numpy
 
+        return to_numpy(matrix)
+    return matrix
 
+
+def iter_row_chunks(matrix, batch_size: int):
+    """按行分块读取矩阵，稠密块转换为 float32，稀疏块保持稀疏"""
+    for start in range(0, matrix.shape[0], batch_size):
+        chunk = matrix[start:start + batch_size]
+        if hasattr(chunk, 'tocsr'):
+            yield start, chunk.astype(np.float32)
+        else:
+            yield start, np.asarray(chunk, dtype=np.float32)
+
+
+def _dense(chunk):
+    return chunk.toarray() if hasattr(chunk, 'toarray') else chunk
+
+
+def _streamed_components(matrix, pca_dim, batch_size, n_iter, oversample, random_state, backend):
+    """
+    流式子空间迭代（随机化 PCA），每轮只按行读取一遍矩阵，内存占用为 O(D × (pca_dim + oversample))
+    :return: (均值 [D], 主成分 [D, pca_dim])
+    """
+    n, d = matrix.shape
+    rank = min(pca_dim + oversample, d)
+    mean = np.zeros(d, dtype=np.float64)
+    for _, chunk in iter_row_chunks(matrix, batch_size):
+        mean += np.asarray(chunk.sum(axis=0), dtype=np.float64).reshape(-1)
+    mean = (mean / n).astype(np.float32)
+
+    if backend == 'torch':
+        import torch
+
+        def block_product(chunk, q, mq):
+            # torch 在 CPU 上多线程计算，转置是视图，不需要复制
+            a = torch.from_numpy(np.require(_dense(chunk), requirements=['C', 'W']))
+            aq = a @ torch.from_numpy(q) - torch.from_numpy(mq)
+            return aq.sum(dim=0).numpy(), (a.T @ aq).numpy()
+    else:
+        def block_product(chunk, q, mq):
+            aq = np.asarray(chunk @ q) - mq
+            return aq.sum(axis=0), np.asarray(chunk.T @ aq)
+
+    def centered_product(q):
+        # 按块计算 (A - 1μ^T)^T (A - 1μ^T) q，不显式构造中心化后的矩阵，稀疏矩阵也不会变稠密
+        q = np.ascontiguousarray(q, dtype=np.float32)
+        mq = mean @ q
+        z = np.zeros((d, q.shape[1]), dtype=np.float64)
+        for _, chunk in iter_row_chunks(matrix, batch_size):
+            aq_sum, product = block_product(chunk, q, mq)
+            z += product
+            z -= np.outer(mean, aq_sum)
+        return z
+
+    q = np.random.default_rng(random_state).standard_normal((d, rank)).astype(np.float32)
+    q, _ = np.linalg.qr(q)
+    for _ in range(n_iter):
+        q, _ = np.linalg.qr(centered_product(q))
+    q = q.astype(np.float32)
+
+    # 在子空间内求协方差矩阵的特征分解
+    small = q.T.astype(np.float64) @ centered_product(q)
+    eigvals, eigvecs = np.linalg.eigh((small + small.T) / 2)
+    order = np.argsort(eigvals)[::-1][:pca_dim]
+    components = (q @ eigvecs[:, order].astype(np.float32))
+    # 与 sklearn 相同的符号约定：每个主成分绝对值最大的分量为正
+    signs = np.sign(components[np.abs(components).argmax(axis=0), np.arange(components.shape[1])])
+    return mean, components * np.where(signs == 0, 1, signs)
+
+
+def pca2embedding(matrix, pca_dim=128, method='full', batch_size=65536, out=None, n_iter=4, oversample=10,
+                  random_state=0):
+    """
+    PCA 降维
+    :param matrix: [N, D] 的特征矩阵，可以是 numpy 数组、.npy 文件路径、np.memmap 或者 scipy 稀疏矩阵
+    :param pca_dim: 降维后的维度
+    :param method: 'full' 在内存中做完整的 PCA（原来的做法）；
+                   'randomized' 按行流式读取的随机化 PCA，稀疏矩阵不会变稠密；
+                   'torch' 与 'randomized' 相同，但矩阵乘法用 torch 在 CPU 上按批计算（多线程）；
+                   'incremental' 使用 sklearn 的 IncrementalPCA 按块拟合
+    :param batch_size: 每次读取的行数
+    :param out: 输出 .npy 文件路径，结果直接写入 memmap；为 None 时返回内存中的数组
+    :param n_iter: 'randomized'/'torch' 的子空间迭代次数
+    :param oversample: 'randomized'/'torch' 额外使用的维度，提高精度
+    :param random_state: 随机种子
+    :return: [N, pca_dim] 的降维结果，out 不为 None 时为 np.memmap
+    """
+    if method == 'full':
+        from sklearn.decomposition import PCA
+
+        pca = PCA(n_components=pca_dim)
+        pca_matrix = pca.fit_transform(load_matrix(matrix))
+        if out is not None:
+            np.save(out, pca_matrix)
+            pca_matrix = np.load(out, mmap_mode='r+')
+        return pca_matrix
+
+    matrix = load_matrix(matrix)
+    n = matrix.shape[0]
+    if method == 'incremental':
+        from sklearn.decomposition import IncrementalPCA
+
+        pca = IncrementalPCA(n_components=pca_dim)
+        for _, chunk in iter_row_chunks(matrix, max(batch_size, pca_dim)):
+            if chunk.shape[0] >= pca_dim:  # 最后一块行数不足时 partial_fit 会报错，跳过
+                pca.partial_fit(_dense(chunk))
+        mean, components = pca.mean_.astype(np.float32), pca.components_.T.astype(np.float32)
+    elif method in ('randomized', 'torch'):
+        mean, components = _streamed_components(matrix, pca_dim, batch_size, n_iter, oversample, random_state, method)
+    else:
+        raise ValueError(f'unknown PCA method {method!r}')
+
+    if out is not None:
+        pca_matrix = np.lib.format.open_memmap(out, mode='w+', dtype=np.float32, shape=(n, components.shape[1]))
+    else:
+        pca_matrix = np.empty((n, components.shape[1]), dtype=np.float32)
+    offset = mean @ components
+    for start, chunk in iter_row_chunks(matrix, batch_size):
+        pca_matrix[start:start + chunk.shape[0]] = np.asarray(chunk @ components) - offset
+    if out is not None:
+        pca_matrix.flush()
+    return pca_matrix
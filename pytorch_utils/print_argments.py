@@ -1,6 +1,5 @@
 import argparse
 
-from texttable import Texttable
 from typing import Dict, Union, Any
 
 
@@ -16,6 +15,8 @@ def print_config(args: Union[Dict[str, Any], argparse.Namespace]) -> None:
     # Yaml config is a dictionary while parser arguments is an object. Use vars() only on parser arguments.
     if type(args) is not dict:
         args = vars(args)
+    from texttable import Texttable
+
     # Sort keys
     keys = sorted(args.keys())
     # Initialize table
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+# 用法：
+'''
+    registry = ExperimentRegistry('outputs/registry.db')
+    exp_folder = create_exp_folder('outputs', registry=registry)
+    logger = Logger(os.path.join(exp_folder, 'log'), registry=registry)
+    logger.save_param_setting(args)
+    ...
+    logger.save_metric(metric)
+
+    # 查询 lr=1e-3 时 Test AUC 最好的 5 次实验
+    registry.query_best('Test AUC', where={'lr': 1e-3}, limit=5)
+'''
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    exp_dir TEXT UNIQUE NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS params (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    name TEXT NOT NULL,
+    value TEXT,
+    num REAL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_params_name_value ON params(name, value);
+CREATE INDEX IF NOT EXISTS idx_params_name_num ON params(name, num);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    epoch INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, name, epoch)
+);
+CREATE TABLE IF NOT EXISTS best_metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    name TEXT NOT NULL,
+    value REAL,
+    epoch INTEGER,
+    mode TEXT,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_best_name_value ON best_metrics(name, value);
+'''
+
+
+def run_dir(path: str) -> str:
+    """
+    把实验文件夹或者其中的 log 文件夹统一为实验文件夹的绝对路径
+    :param path: 实验文件夹，或者 Logger 的 save_dir（exp/log）
+    :return: 实验文件夹的绝对路径
+    """
+    path = os.path.abspath(path)
+    if os.path.basename(path) == 'log':
+        path = os.path.dirname(path)
+    return path
+
+
+def as_number(value):
+    # 数值参数同时以 REAL 保存，查询时 1e-3 和 0.001 可以匹配
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_pending(conn, lock, pending):
+    # 不引用 ExperimentRegistry 本身，可以作为 weakref.finalize 的回调
+    with lock:
+        if not pending:
+            return
+        rows = list(pending)
+        pending.clear()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO metrics (run_id, epoch, name, value) VALUES (?, ?, ?, ?)', rows)
+
+
+class ExperimentRegistry:
+    def __init__(self, db_path: str, batch_size: int = 1000, flush_interval: float = 10.0):
+        """
+        记录实验参数和指标的 SQLite 数据库，多个进程可以同时写入同一个数据库
+        没有调用 close 时，缓存的指标在 registry 被回收或者进程正常退出时写入
+        :param db_path: 数据库文件路径
+        :param batch_size: 逐个 epoch 写入的指标攒够多少条后在一个事务中提交
+        :param flush_interval: 距离上次提交超过多少秒时，即使没有攒够 batch_size 条也提交，进程崩溃时最多丢失这段时间的指标
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._last_flush = time.time()
+        self._run_ids = {}  # exp_dir -> run_id，避免每个 epoch 都查询一次
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        # WAL 模式下读写互不阻塞，适合多个训练进程同时写入
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        self._finalizer = weakref.finalize(self, _write_pending, self.conn, self._lock, self._pending)
+
+    def register_run(self, exp_dir: str) -> int:
+        """
+        注册一次实验，已经注册过时返回原来的 run_id
+        :param exp_dir: 实验文件夹
+        :return: run_id
+        """
+        exp_dir = run_dir(exp_dir)
+        if exp_dir in self._run_ids:
+            return self._run_ids[exp_dir]
+        with self._lock, self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO runs (exp_dir, created) VALUES (?, ?)', (exp_dir, time.time()))
+            run_id = self.conn.execute('SELECT run_id FROM runs WHERE exp_dir = ?', (exp_dir,)).fetchone()[0]
+        self._run_ids[exp_dir] = run_id
+        return run_id
+
+    def log_params(self, exp_dir: str, args) -> None:
+        """
+        记录实验参数
+        :param exp_dir: 实验文件夹
+        :param args: dict 或者 argparse.Namespace
+        """
+        if type(args) is not dict:
+            args = vars(args)
+        run_id = self.register_run(exp_dir)
+        rows = [(run_id, k, str(v), as_number(v)) for k, v in args.items()]
+        with self._lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO params (run_id, name, value, num) VALUES (?, ?, ?, ?)', rows)
+
+    def log_epoch(self, exp_dir: str, epoch: int, metrics: dict) -> None:
+        """
+        缓存一个 epoch 的指标，攒够 batch_size 条或者距离上次提交超过 flush_interval 秒后批量写入
+        :param exp_dir: 实验文件夹
+        :param epoch: epoch（从 1 开始）
+        :param metrics: 指标名 -> 数值
+        """
+        run_id = self.register_run(exp_dir)
+        with self._lock:
+            self._pending.extend((run_id, epoch, k, float(v)) for k, v in metrics.items())
+        if len(self._pending) >= self.batch_size or time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def log_metrics(self, exp_dir: str, metric: dict) -> None:
+        """
+        一次写入所有 epoch 的指标
+        :param exp_dir: 实验文件夹
+        :param metric: 指标名 -> 每个 epoch 的数值列表
+        """
+        run_id = self.register_run(exp_dir)
+        with self._lock:
+            self._pending.extend((run_id, epoch, k, float(v))
+                                 for k, values in metric.items() for epoch, v in enumerate(values, start=1))
+        self.flush()
+
+    def log_best(self, exp_dir: str, best: dict) -> None:
+        """
+        记录最优指标
+        :param exp_dir: 实验文件夹
+        :param best: 指标名 -> (epoch, 最优值, 'max' 或 'min')
+        """
+        run_id = self.register_run(exp_dir)
+        rows = [(run_id, k, float(value), epoch, mode) for k, (epoch, value, mode) in best.items()]
+        with self._lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO best_metrics (run_id, name, value, epoch, mode) '
+                                  'VALUES (?, ?, ?, ?, ?)', rows)
+
+    def flush(self) -> None:
+        """将缓存的指标在一个事务中写入数据库"""
+        _write_pending(self.conn, self._lock, self._pending)
+        self._last_flush = time.time()
+
+    def query_best(self, metric: str, where: dict = None, limit: int = 10) -> list:
+        """
+        查询某个指标最好的若干次实验
+        :param metric: 指标名，例如 'Test AUC'
+        :param where: 参数过滤条件，例如 {'lr': 1e-3, 'optimizer': 'Adam'}
+        :param limit: 返回的实验数
+        :return: [(exp_dir, 最优值, epoch), ...]
+        """
+        self.flush()
+        row = self.conn.execute('SELECT mode FROM best_metrics WHERE name = ? LIMIT 1', (metric,)).fetchone()
+        if row is None:
+            return []
+        # loss 类指标越小越好
+        order = 'ASC' if row[0] == 'min' else 'DESC'
+
+        joins, values = [], []
+        for i, (name, value) in enumerate((where or {}).items()):
+            number = as_number(value)
+            column = 'num' if number is not None else 'value'
+            joins.append(f'JOIN params p{i} ON p{i}.run_id = b.run_id AND p{i}.name = ? AND p{i}.{column} = ?')
+            values.extend([name, number if number is not None else str(value)])
+        sql = (f'SELECT r.exp_dir, b.value, b.epoch FROM best_metrics b JOIN runs r ON r.run_id = b.run_id '
+               f'{" ".join(joins)} WHERE b.name = ? ORDER BY b.value {order} LIMIT ?')
+        return self.conn.execute(sql, values + [metric, limit]).fetchall()
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        """执行任意只读查询"""
+        self.flush()
+        return self.conn.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        self._finalizer()  # 写入缓存的指标，之后进程退出时不再重复写入
+        self.conn.close()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import json
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .checkpoint import write_json
+
+# 4.best_metric.log 中的一行，例如 "Test AUC: At the 12th epoch, the maximum test auc is 0.9640."
+BEST_METRIC_PATTERN = re.compile(
+    r'^\s*(?P<metric>.+?): At the (?P<epoch>\d+)th epoch, the (?P<mode>maximum|minimum) .+ is (?P<value>.+)\.$')
+BEST_METRIC_FILE = os.path.join('log', '4.best_metric.log')
+INDEX_FILE = '.results_index.json'
+
+ResultRow = namedtuple('ResultRow', ['exp', 'metric', 'value', 'epoch', 'mode'])
+
+
+def read_tail(path: str, tail_bytes: int = 65536) -> list:
+    """
+    只读取文件末尾 tail_bytes 个字节，返回其中完整的行
+    :param path: 文件路径
+    :param tail_bytes: 读取的字节数
+    :return: 行列表
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(size - tail_bytes, 0))
+        data = f.read()
+    lines = data.decode('utf8', errors='replace').splitlines()
+    if size > tail_bytes:
+        lines = lines[1:]  # 第一行可能只读到了一半
+    return lines
+
+
+def parse_best_metric(lines: list) -> list:
+    """
+    按名字解析 4.best_metric.log 中的指标
+    :param lines: 文件中的行
+    :return: [(指标名, 最优值, epoch, 'max' 或 'min'), ...]
+    """
+    metrics = []
+    for line in lines:
+        match = BEST_METRIC_PATTERN.match(line.rstrip())
+        if match is None:
+            continue
+        try:
+            value = float(match.group('value'))
+        except ValueError:
+            continue
+        metrics.append((match.group('metric').strip(), value, int(match.group('epoch')),
+                        'max' if match.group('mode') == 'maximum' else 'min'))
+    return metrics
+
+
+def scan_results(directory: str, num_workers: int = 16, use_cache: bool = True) -> list:
+    """
+    并行扫描 directory 下所有实验文件夹的 4.best_metric.log
+    解析结果按 (mtime, size) 缓存在 directory/.results_index.json 中，再次扫描时只读取新增或者修改过的实验
+    :param directory: 存放 exp 文件夹的目录
+    :param num_workers: 并行读取的线程数，网络存储上可以适当调大
+    :param use_cache: 是否使用缓存
+    :return: ResultRow 列表，按实验编号排序
+    """
+    index_path = os.path.join(directory, INDEX_FILE)
+    cache = {}
+    if use_cache and os.path.exists(index_path):
+        try:
+            with open(index_path, 'r', encoding='utf8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+    exp_folders = [entry.name for entry in os.scandir(directory) if entry.is_dir()]
+
+    def index_one(exp_folder):
+        log_path = os.path.join(directory, exp_folder, BEST_METRIC_FILE)
+        try:
+            stat = os.stat(log_path)
+        except FileNotFoundError:
+            return exp_folder, None
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        cached = cache.get(exp_folder)
+        if cached is not None and cached['stamp'] == stamp:
+            return exp_folder, cached
+        return exp_folder, {'stamp': stamp, 'metrics': parse_best_metric(read_tail(log_path))}
+
+    with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+        entries = {exp: entry for exp, entry in executor.map(index_one, exp_folders) if entry is not None}
+
+    if use_cache and entries != cache:
+        write_json(entries, index_path)
+
+    def exp_key(name):
+        # exp2 排在 exp10 前面
+        digits = re.sub(r'\D', '', name)
+        return (int(digits) if digits else float('inf'), name)
+
+    return [ResultRow(exp, *metric) for exp in sorted(entries, key=exp_key) for metric in entries[exp]['metrics']]
+
+
+def best_by_metric(rows: list) -> dict:
+    """
+    找到每个指标的最优值以及取得最优值的所有实验，最优值相同的实验都会被保留
+    :param rows: scan_results 的返回值
+    :return: 指标名 -> (最优值, [ResultRow, ...])
+    """
+    best = {}
+    for row in rows:
+        current = best.get(row.metric)
+        if current is None or (row.value > current[0] if row.mode == 'max' else row.value < current[0]):
+            best[row.metric] = (row.value, [row])
+        elif row.value == current[0]:
+            current[1].append(row)
+    return best
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import hashlib
+import json
+import os
+import time
+
+from .checkpoint import write_json
+
+# 用法：
+'''
+    cache = RunCache('outputs/.run_cache')
+    fingerprint = code_fingerprint(['train.py', 'models']) + data_fingerprint(args.data_dir)
+    metric = cached_run(train, args, cache, fingerprint=fingerprint)  # 完全相同的运行已经完成时直接返回保存的指标
+
+    # sweep 中跳过已经完成的配置
+    run_sweep(train, configs, cache=cache, fingerprint=fingerprint)
+'''
+
+# 不影响训练结果的参数，不参与计算缓存键
+IGNORED_ARGS = ('output_dir', 'exp_dir', 'use_tensorboard')
+
+
+def _jsonable(value):
+    # numpy 数组和标量、torch 张量转换为 Python 对象，其余对象用 repr
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return repr(value)
+
+
+def canonical_args(args, ignore=IGNORED_ARGS) -> dict:
+    """
+    :param args: argparse.Namespace 或者 dict
+    :param ignore: 不参与比较的参数名
+    :return: 按参数名排序、可以 JSON 序列化的字典
+    """
+    if type(args) is not dict:
+        args = vars(args)
+    return {k: json.loads(json.dumps(v, default=_jsonable)) for k, v in sorted(args.items()) if k not in ignore}
+
+
+def run_key(args, seed=None, fingerprint: str = None, ignore=IGNORED_ARGS) -> str:
+    """
+    一次运行的缓存键：参数、随机种子和代码/数据指纹的规范化 JSON 的 sha256
+    1e-3 和 0.001 的 JSON 表示相同，参数的顺序不影响结果
+    :param args: argparse.Namespace 或者 dict
+    :param seed: 随机种子，默认为 args.seed
+    :param fingerprint: 代码或数据的指纹，见 code_fingerprint、data_fingerprint
+    :param ignore: 不参与比较的参数名
+    :return: 十六进制字符串
+    """
+    canonical = canonical_args(args, ignore)
+    if seed is None:
+        seed = canonical.get('seed')
+    payload = json.dumps({'args': canonical, 'seed': seed, 'fingerprint': fingerprint},
+                         sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _iter_files(paths, suffixes=None):
+    for path in sorted(paths):
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d != '__pycache__')
+                for name in sorted(files):
+                    if suffixes is None or name.endswith(tuple(suffixes)):
+                        yield os.path.join(root, name)
+        elif os.path.exists(path):
+            yield path
+
+
+def code_fingerprint(paths, suffixes=('.py',)) -> str:
+    """
+    代码的指纹：文件内容的 sha256，修改代码后缓存自动失效
+    :param paths: 文件或者目录列表
+    :param suffixes: 目录中参与计算的文件后缀
+    :return: 十六进制字符串
+    """
+    h = hashlib.sha256()
+    for path in _iter_files(paths, suffixes):
+        h.update(os.path.relpath(path).encode())
+        with open(path, 'rb') as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def data_fingerprint(path: str, content: bool = False) -> str:
+    """
+    数据的指纹，默认只使用文件名、大小和修改时间，不读取文件内容
+    :param path: 数据文件或者目录
+    :param content: 为 True 时按文件内容计算（数据较大时较慢）
+    :return: 十六进制字符串
+    """
+    h = hashlib.sha256()
+    for file in _iter_files([path]):
+        h.update(os.path.relpath(file, path).encode())
+        if content:
+            with open(file, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+        else:
+            stat = os.stat(file)
+            h.update(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return h.hexdigest()
+
+
+class RunCache:
+    def __init__(self, directory: str):
+        """
+        已经完成的运行的指标，每次运行一个 JSON 文件，文件名为缓存键，多个进程可以同时读写
+        :param directory: 缓存目录
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def get(self, key: str):
+        """
+        :param key: run_key 的返回值
+        :return: 已经完成时返回 {'key', 'args', 'exp_dir', 'metric', 'finished'}，否则返回 None
+        """
+        try:
+            with open(self._path(key), 'r', encoding='utf8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, args, exp_dir: str, metric: dict) -> None:
+        """
+        记录一次完成的运行，先写临时文件再替换，中断时不会留下不完整的记录
+        :param key: run_key 的返回值
+        :param args: 这次运行的参数
+        :param exp_dir: 实验文件夹
+        :param metric: 训练函数返回的指标
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        record = {'key': key, 'args': canonical_args(args, ignore=()), 'exp_dir': exp_dir,
+                  'metric': json.loads(json.dumps(metric, default=_jsonable)), 'finished': time.time()}
+        write_json(record, path)
+
+    def remove(self, key: str) -> None:
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+
+def cached_run(train_fn, args, cache: RunCache, fingerprint: str = None, ignore=IGNORED_ARGS):
+    """
+    参数、随机种子和指纹都相同的运行已经完成时直接返回保存的指标，否则调用 train_fn(args) 并记录结果
+    :param train_fn: 训练函数 train_fn(args) -> 指标字典
+    :param args: argparse.Namespace
+    :param cache: RunCache
+    :param fingerprint: 代码或数据的指纹
+    :param ignore: 不参与比较的参数名
+    :return: 指标字典
+    """
+    key = run_key(args, fingerprint=fingerprint, ignore=ignore)
+    record = cache.get(key)
+    if record is not None:
+        return record['metric']
+    metric = train_fn(args)
+    cache.put(key, args, getattr(args, 'exp_dir', None), metric or {})
+    return metric
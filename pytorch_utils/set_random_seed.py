@@ -1,7 +1,9 @@
 import random
 
-import numpy as np
-import torch
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+torch = lazy_import('torch')
 
 
 def set_seed(seed: int) -> None:
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import csv
+import itertools
+import math
+import os
+import multiprocessing
+import random
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .arg_parse import get_argparse
+from .logger import is_loss
+from .run_cache import run_key
+from .utils import create_exp_folder, set_seed
+
+# 用法：
+'''
+    # train.py
+    def train(args):
+        ...  # args.exp_dir 是为这次运行创建的实验文件夹，随机种子已经按 args.seed 设置好
+        return {'Test AUC': auc_list, 'Train Loss': loss_list}  # 每个 epoch 的列表或者单个数值
+
+    if __name__ == '__main__':
+        configs = expand_grid({'lr': [1e-3, 1e-2], 'dropout': [0.3, 0.5], 'seed': [0, 1, 2]})
+        configs += sample_random({'lr': log_uniform(1e-4, 1e-1), 'weight_decay': [0, 1e-5, 1e-4]}, n=20)
+        results = run_sweep(train, configs, base_argv=['--epochs', '200', '--device', 'cpu'])
+
+        # 提前终止表现差的配置（ASHA），训练代码中的 EarlyStopping 会在被淘汰时把 early_stop 置为 True
+        results = run_sweep(train, configs, base_argv=['--epochs', '200'], asha=ASHA(min_epochs=5))
+
+    # ASHA(metric=...) 且训练循环中没有 EarlyStopping 时，训练循环需要自己检查是否被淘汰，否则会一直训练到 max_epochs
+    for epoch in range(args.epochs):
+        ...
+        if logger.log_metric({'Test AUC': auc}):  # 被淘汰时返回 True
+            break
+        # 或者不使用 Logger 时：
+        trial = current_trial()
+        if trial is not None and trial.report(epoch + 1, auc):
+            break
+'''
+
+RESULTS_FILE = 'sweep_results.csv'
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+_current_trial = None  # 当前进程中正在运行的 Trial，由 _run_config 设置
+
+
+class ASHA:
+    """Asynchronous successive halving: a trial continues past a rung only if it is in the top 1/reduction_factor."""
+
+    def __init__(self, min_epochs: int = 1, reduction_factor: int = 3, max_epochs: int = None, metric: str = None,
+                 mode: str = 'max'):
+        """
+        :param min_epochs: 第一个 rung 的 epoch 数，之后的 rung 依次乘以 reduction_factor
+        :param reduction_factor: 每个 rung 只保留前 1/reduction_factor 的配置
+        :param max_epochs: 最大 epoch 数，默认为 args.epochs
+        :param metric: 用于比较的指标名，通过 Logger.log_metric 报告；为 None 时使用 EarlyStopping 的验证集 loss
+        :param mode: metric 越大越好为 'max'，越小越好为 'min'，metric 为 None 时忽略
+        """
+        self.min_epochs = min_epochs
+        self.reduction_factor = reduction_factor
+        self.max_epochs = max_epochs
+        self.metric = metric
+        self.mode = mode
+
+    def rung_epochs(self, max_epochs: int) -> list:
+        rungs, epoch = [], self.min_epochs
+        while epoch < max_epochs:
+            rungs.append(epoch)
+            epoch *= self.reduction_factor
+        return rungs
+
+
+class Trial:
+    """Per-run handle that records rung results in state shared by all workers and decides whether to stop."""
+
+    def __init__(self, rung_results, lock, rung_epochs: list, reduction_factor: int, metric: str = None,
+                 mode: str = 'max'):
+        """
+        :param rung_results: 所有进程共享的字典，rung 的 epoch -> 到达该 rung 的配置的分数列表
+        :param lock: 保护 rung_results 的锁
+        :param rung_epochs: 各个 rung 的 epoch
+        :param reduction_factor: 见 ASHA
+        :param metric: 见 ASHA
+        :param mode: 见 ASHA
+        """
+        self.rung_results = rung_results
+        self.lock = lock
+        self.rung_epochs = rung_epochs
+        self.reduction_factor = reduction_factor
+        self.metric = metric
+        self.mode = mode
+        self.epoch = 0
+        self.should_stop = False
+        self._next_rung = 0
+
+    def report(self, epoch: int, value: float) -> bool:
+        """
+        报告一个 epoch 的指标，按 mode 比较
+        :return: 是否应该停止训练
+        """
+        return self.report_score(epoch, value if self.mode == 'max' else -value)
+
+    def report_score(self, epoch: int, score: float) -> bool:
+        """
+        报告一个 epoch 的分数（越大越好），每经过一个 rung 就与其他配置在该 rung 的分数比较
+        报告不必每个 epoch 都有，跳过的 rung 用当前分数代替
+        :return: 是否应该停止训练
+        """
+        self.epoch = epoch
+        while not self.should_stop and self._next_rung < len(self.rung_epochs) \
+                and epoch >= self.rung_epochs[self._next_rung]:
+            rung = self.rung_epochs[self._next_rung]
+            self._next_rung += 1
+            with self.lock:
+                scores = list(self.rung_results.get(rung, [])) + [score]
+                self.rung_results[rung] = scores
+            # 到达该 rung 的配置还不够多时先继续训练，否则只保留前 1/reduction_factor
+            if len(scores) >= self.reduction_factor:
+                keep = len(scores) // self.reduction_factor
+                if score < sorted(scores, reverse=True)[keep - 1]:
+                    self.should_stop = True
+        return self.should_stop
+
+
+def current_trial():
+    """
+    当前进程中正在运行的 Trial，不在 ASHA sweep 中时为 None
+    EarlyStopping 和 Logger 通过它报告每个 epoch 的指标，训练代码不需要修改
+    """
+    return _current_trial
+
+
+def expand_grid(spec: dict) -> list:
+    """
+    网格搜索：参数名 -> 候选值列表，返回所有组合
+    :param spec: 例如 {'lr': [1e-3, 1e-2], 'dropout': [0.3, 0.5]}
+    :return: [{'lr': 1e-3, 'dropout': 0.3}, ...]
+    """
+    names = list(spec)
+    return [dict(zip(names, values)) for values in itertools.product(*(spec[name] for name in names))]
+
+
+def log_uniform(low: float, high: float):
+    """在 [low, high] 上按对数均匀采样，用于 sample_random"""
+    def sample(rng):
+        return math.exp(rng.uniform(math.log(low), math.log(high)))
+    return sample
+
+
+def sample_random(spec: dict, n: int, seed: int = 0) -> list:
+    """
+    随机搜索：参数名 -> 候选值列表（均匀选择）或者 callable(random.Random)（例如 log_uniform）
+    :param spec: 搜索空间
+    :param n: 采样的配置数
+    :param seed: 随机种子
+    :return: 配置列表
+    """
+    rng = random.Random(seed)
+    return [{name: values(rng) if callable(values) else rng.choice(list(values)) for name, values in spec.items()}
+            for _ in range(n)]
+
+
+def make_args(overrides: dict, base_argv: list = None, parser=None):
+    """
+    由 get_argparse 的默认值、base_argv 和 overrides 生成一次运行的参数
+    :param overrides: 参数名 -> 值
+    :param base_argv: 所有运行共用的命令行参数，例如 ['--epochs', '200']
+    :param parser: argparse.ArgumentParser，默认为 get_argparse()
+    :return: argparse.Namespace
+    """
+    parser = parser if parser is not None else get_argparse()
+    args = parser.parse_args(base_argv or [])
+    for name, value in overrides.items():
+        if not hasattr(args, name):
+            raise ValueError(f'Unknown argument {name!r} in sweep config')
+        setattr(args, name, value)
+    return args
+
+
+def limit_threads(num_threads: int) -> None:
+    """
+    限制当前进程中 BLAS/OpenMP/torch 的线程数，多个进程同时训练时避免线程数超过 CPU 核数
+    :param num_threads: 线程数
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(num_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(num_threads)
+    except ImportError:
+        pass
+    # torch 还没有导入时，导入后会读取 OMP_NUM_THREADS
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(num_threads)
+
+
+def _init_sweep_worker(num_threads):
+    if num_threads is not None:
+        limit_threads(num_threads)
+
+
+def _run_config(item):
+    global _current_trial
+    train_fn, overrides, base_argv, output_dir, trial_args = item
+    start = time.perf_counter()
+    exp_dir = None
+    trial = _current_trial = Trial(*trial_args) if trial_args is not None else None
+    try:
+        # 参数错误也记录为这一次运行失败，不影响其他配置
+        args = make_args(overrides, base_argv)
+        # 每次运行在 output_dir 下得到独立的 expN 文件夹，create_exp_folder 用原子的 mkdir 分配序号，多个进程不会冲突
+        args.exp_dir = exp_dir = create_exp_folder(output_dir or args.output_dir)
+        set_seed(args.seed)
+        metric = train_fn(args)
+        result = {'config': overrides, 'exp_dir': exp_dir, 'status': 'ok', 'metric': metric or {},
+                  'elapsed': time.perf_counter() - start}
+    except Exception:
+        result = {'config': overrides, 'exp_dir': exp_dir, 'status': 'failed', 'metric': {},
+                  'error': traceback.format_exc(), 'elapsed': time.perf_counter() - start}
+    finally:
+        _current_trial = None
+    if trial is not None:
+        result['epochs'] = trial.epoch
+        if trial.should_stop and result['status'] == 'ok':
+            result['status'] = 'pruned'
+    return result
+
+
+def best_value(key: str, value):
+    """每个 epoch 的列表取最优值（名字中包含 loss 的取最小值），单个数值原样返回"""
+    if isinstance(value, (list, tuple)) or hasattr(value, 'tolist'):
+        values = list(value.tolist() if hasattr(value, 'tolist') else value)
+        if not values:
+            return None
+        value = min(values) if is_loss(key) else max(values)
+    return value.item() if hasattr(value, 'item') else value
+
+
+def write_results_table(results: list, path: str) -> None:
+    """
+    把所有运行的结果写入一张表：参数、实验文件夹、状态、耗时和每个指标的最优值
+    先写临时文件再替换，运行中途打开也能看到完整的表
+    :param results: run_sweep 的结果列表
+    :param path: .csv 文件路径
+    """
+    param_names = list(dict.fromkeys(k for r in results for k in r['config']))
+    metric_names = list(dict.fromkeys(k for r in results for k in r['metric']))
+    header = param_names + ['exp_dir', 'status', 'elapsed'] + metric_names
+    tmp_path = f'{path}.tmp.{os.getpid()}'
+    with open(tmp_path, 'w', encoding='utf8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for r in results:
+            writer.writerow([r['config'].get(k) for k in param_names]
+                            + [r['exp_dir'], r['status'], f"{r['elapsed']:.1f}"]
+                            + [best_value(k, r['metric'][k]) if k in r['metric'] else None for k in metric_names])
+    os.replace(tmp_path, path)
+
+
+def run_sweep(train_fn, configs: list, base_argv: list = None, output_dir: str = None, num_workers: int = None,
+              threads_per_worker: int = None, results_file: str = None, verbose: bool = True,
+              asha: ASHA = None, cache=None, fingerprint: str = None) -> list:
+    """
+    在进程池中运行一组超参数配置，每完成一次运行就更新汇总表
+    :param train_fn: 训练函数 train_fn(args) -> 指标字典，必须定义在模块顶层（可以被 pickle）
+    :param configs: 配置列表，见 expand_grid 和 sample_random
+    :param base_argv: 所有运行共用的命令行参数
+    :param output_dir: 实验文件夹的父目录，默认为 args.output_dir
+    :param num_workers: 同时运行的进程数，默认为 CPU 核数，为 1 时在当前进程中依次运行
+    :param threads_per_worker: 每个进程的线程数，默认为 CPU 核数 // num_workers
+    :param results_file: 汇总表路径，默认为 output_dir/sweep_results.csv
+    :param verbose: 是否打印每次运行的结果
+    :param asha: 提前终止的策略，为 None 时每个配置都训练到结束。淘汰只是一个信号：训练循环必须在
+                 EarlyStopping.early_stop、Logger.log_metric 的返回值或者 current_trial().should_stop 为 True 时退出，
+                 否则被淘汰的配置仍会训练到 max_epochs
+    :param cache: run_cache.RunCache，参数、随机种子和指纹都相同的运行已经完成时直接使用保存的指标，不再训练
+    :param fingerprint: 代码或数据的指纹，见 run_cache.code_fingerprint、run_cache.data_fingerprint
+    :raises ValueError: 某个配置中有 get_argparse 不认识的参数名，此时不会开始任何运行
+    :return: [{'config', 'exp_dir', 'status', 'metric', 'elapsed', ('error'), ('epochs')}, ...]，按配置顺序排列，
+             被 ASHA 提前终止的运行 status 为 'pruned'，从缓存中读取的运行 status 为 'cached'
+    """
+    # 开始任何运行之前检查所有配置，参数名写错时立即报错，而不是在其他配置训练完之后才中断整个 sweep
+    errors = []
+    for config in configs:
+        try:
+            make_args(config, base_argv)
+        except ValueError as e:
+            errors.append(f'{config}: {e}')
+    if errors:
+        raise ValueError('Invalid sweep configs:\n' + '\n'.join(errors))
+    if output_dir is None:
+        output_dir = make_args({}, base_argv).output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    if results_file is None:
+        results_file = os.path.join(output_dir, RESULTS_FILE)
+    cpu_count = os.cpu_count() or 1
+    if num_workers is None:
+        num_workers = cpu_count
+    num_workers = max(min(num_workers, len(configs)), 1)
+    if threads_per_worker is None:
+        threads_per_worker = max(cpu_count // num_workers, 1)
+
+    manager = None
+    trial_args = None
+    if asha is not None:
+        max_epochs = asha.max_epochs or make_args({}, base_argv).epochs
+        if num_workers > 1:
+            # 各个 rung 的分数由所有工作进程共享
+            manager = multiprocessing.Manager()
+            rung_results, lock = manager.dict(), manager.Lock()
+        else:
+            rung_results, lock = {}, threading.Lock()
+        trial_args = (rung_results, lock, asha.rung_epochs(max_epochs), asha.reduction_factor, asha.metric, asha.mode)
+
+    items = [(train_fn, config, base_argv, output_dir, trial_args) for config in configs]
+    results = [None] * len(items)
+    keys = [run_key(make_args(config, base_argv), fingerprint=fingerprint) for config in configs] \
+        if cache is not None else None
+
+    def finish(index, result):
+        results[index] = result
+        # 被 ASHA 提前终止的运行的结果取决于同时运行的其他配置，不写入缓存
+        if cache is not None and result['status'] == 'ok':
+            args = make_args(configs[index], base_argv)
+            cache.put(keys[index], args, result['exp_dir'], result['metric'])
+        write_results_table([r for r in results if r is not None], results_file)
+        if verbose:
+            metric = {k: best_value(k, v) for k, v in result['metric'].items()}
+            print(f"[{sum(r is not None for r in results)}/{len(results)}] {result['status']} "
+                  f"{result['config']} {metric} ({result['elapsed']:.1f}s)")
+            if result['status'] == 'failed':
+                print(result['error'])
+
+    pending = []
+    for index in range(len(items)):
+        record = cache.get(keys[index]) if cache is not None else None
+        if record is None:
+            pending.append(index)
+            continue
+        finish(index, {'config': configs[index], 'exp_dir': record['exp_dir'], 'status': 'cached',
+                       'metric': record['metric'], 'elapsed': 0.0})
+
+    try:
+        if num_workers == 1 or len(pending) <= 1:
+            for index in pending:
+                finish(index, _run_config(items[index]))
+        else:
+            # 进程池的大小固定为 num_workers，任务按完成顺序回收，汇总表随之更新
+            with ProcessPoolExecutor(max_workers=min(num_workers, len(pending)), initializer=_init_sweep_worker,
+                                     initargs=(threads_per_worker,)) as executor:
+                futures = {executor.submit(_run_config, items[index]): index for index in pending}
+                for future in as_completed(futures):
+                    finish(futures[future], future.result())
+    finally:
+        if manager is not None:
+            manager.shutdown()
+
+    if asha is not None and verbose:
+        used = sum(r.get('epochs', 0) for r in results)
+        print(f'ASHA used {used} epochs, {used / max(max_epochs * len(results), 1):.1%} of the full sweep '
+              f'({sum(r["status"] == "pruned" for r in results)} of {len(results)} runs stopped early)')
+    return results
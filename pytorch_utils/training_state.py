@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18
+# @Author  : Zhong Zhijie
+
+import os
+import random
+
+from .checkpoint import atomic_save
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+torch = lazy_import('torch')
+
+# 用法：
+'''
+    # 中断后用 --resume_dir outputs/exp3 重新启动，继续使用原来的实验文件夹
+    exp_dir = args.resume_dir or create_exp_folder(args.output_dir)
+    state = TrainingState(os.path.join(exp_dir, 'model', STATE_FILE), every=args.save_state_every)
+    components = dict(model=model, optimizer=optimizer, scheduler=scheduler,
+                      early_stopping=early_stopping, logger=logger)
+    resumed = state.load(**components)  # 没有断点时返回 None，从头开始训练
+    start_epoch = resumed['epoch'] if resumed else 0
+    metric = resumed['metric'] if resumed else defaultdict(list)
+
+    for epoch in range(start_epoch, args.epochs):
+        ...
+        logger.log_metric(...)
+        early_stopping(val_loss, model)
+        state.maybe_save(epoch + 1, metric=metric, **components)  # 每 save_state_every 个 epoch 写一次断点
+        if early_stopping.early_stop:
+            break
+
+    DataLoader 使用自己的 generator 时，把它也放进 components（例如 generator=g），随机数状态一起保存
+    GPU 上要做到逐位一致还需要确定性的算子：set_seed 已经设置了 cudnn.deterministic
+'''
+
+STATE_FILE = 'training_state.pt'
+
+
+def get_rng_state() -> dict:
+    """
+    :return: Python、NumPy、torch CPU 和所有 GPU 的随机数状态
+    """
+    state = {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state: dict) -> None:
+    """
+    :param state: get_rng_state 的返回值
+    """
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def _to_device(obj, device):
+    # 递归地把嵌套的字典、列表中的张量移动到 device，保留模型状态字典的 _metadata（记录各层的版本号）
+    if torch.is_tensor(obj):
+        return obj.to(device)
+    if isinstance(obj, dict):
+        moved = obj.copy()
+        for k, v in obj.items():
+            moved[k] = _to_device(v, device)
+        if hasattr(obj, '_metadata'):
+            moved._metadata = obj._metadata
+        return moved
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_device(v, device) for v in obj)
+    return obj
+
+
+def _get_state(component):
+    # torch.Generator 没有 state_dict，其余组件（模型、优化器、学习率调度器、EarlyStopping、Logger 等）都有
+    if isinstance(component, torch.Generator):
+        return component.get_state()
+    return component.state_dict()
+
+
+def _set_state(component, state):
+    if isinstance(component, torch.Generator):
+        component.set_state(state)
+    else:
+        component.load_state_dict(state)
+
+
+class TrainingState:
+    def __init__(self, path: str, every: int = 1, trace_func=print):
+        """
+        可以恢复的训练断点：模型、优化器、学习率调度器、EarlyStopping 的计数和最优值、指标历史和所有随机数状态
+        在 epoch 结束时保存，恢复之后继续训练的结果与没有中断时逐位相同
+        :param path: 断点文件的路径，每次覆盖写入，中断时不会留下不完整的文件
+        :param every: maybe_save 每多少个 epoch 写一次
+        :param trace_func: 打印信息的函数
+        """
+        self.path = path
+        self.every = every
+        self.trace_func = trace_func
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def save(self, epoch: int, metric=None, **components) -> None:
+        """
+        :param epoch: 已经完成的 epoch 数，恢复后从这个 epoch 继续
+        :param metric: 训练循环中自己维护的指标历史，原样保存
+        :param components: 名字 -> 有 state_dict 的对象或者 torch.Generator
+        """
+        early_stopping = components.get('early_stopping')
+        if early_stopping is not None:
+            early_stopping.flush()  # 最优模型文件先落盘，与断点中的 EarlyStopping 状态保持一致
+        state = {'epoch': epoch, 'metric': metric, 'rng': get_rng_state(),
+                 'components': {name: _get_state(component) for name, component in components.items()
+                                if component is not None}}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        atomic_save(state, self.path)
+
+    def maybe_save(self, epoch: int, metric=None, **components) -> bool:
+        """
+        epoch 是 every 的倍数时保存
+        :return: 是否保存了断点
+        """
+        if epoch % self.every != 0:
+            return False
+        self.save(epoch, metric, **components)
+        return True
+
+    def load(self, map_location=None, strict: bool = True, **components):
+        """
+        读取断点并恢复各个组件的状态，随机数状态最后恢复
+        断点总是先读到 CPU 上：随机数状态必须是 CPU 上的 ByteTensor，EarlyStopping 的最优模型也保存在 CPU 上
+        :param map_location: 模型、优化器等组件的状态移动到的设备，例如 'cuda:0'，为 None 时保持在 CPU 上，
+                             load_state_dict 会把它们复制到组件所在的设备
+        :param strict: 为 True 时断点中缺少某个组件会报错
+        :param components: 与 save 时相同的名字 -> 对象
+        :return: 没有断点时返回 None，否则返回 {'epoch', 'metric'}
+        """
+        if not self.exists():
+            return None
+        from .early_stopping import EarlyStopping
+
+        state = torch.load(self.path, map_location='cpu', weights_only=False)
+        for name, component in components.items():
+            if component is None:
+                continue
+            if name not in state['components']:
+                if strict:
+                    raise KeyError(f'{self.path} has no state for {name!r}')
+                continue
+            component_state = state['components'][name]
+            if map_location is not None and not isinstance(component, (torch.Generator, EarlyStopping)):
+                component_state = _to_device(component_state, map_location)
+            _set_state(component, component_state)
+        set_rng_state(state['rng'])
+        self.trace_func(f'Resumed training state from {self.path} at epoch {state["epoch"]}')
+        return {'epoch': state['epoch'], 'metric': state['metric']}
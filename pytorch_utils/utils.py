@@ -2,21 +2,27 @@
 # @Time    : 2023/11/20
 # @Author  : Zhong Zhijie
 
+import atexit
+import csv
 import logging
 import os
+import queue
 import random
+import re
 import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
 
-import numpy as np
-import torch
-from matplotlib import pyplot as plt
-from texttable import Texttable
-from torch.nn import Module
+from .checkpoint import DeltaCheckpointStore, is_compressed_checkpoint, is_delta_store, is_sharded_checkpoint, \
+    load_compressed, load_sharded, save_compressed, save_sharded
+from .lazy import lazy_import
+from .results import best_by_metric, scan_results
 
-from openpyxl import Workbook, load_workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font, Alignment
+# torch、matplotlib、openpyxl、texttable 都在第一次使用时才导入，只用 mkdir 等函数时不需要付出导入的代价
+np = lazy_import('numpy')
+torch = lazy_import('torch')
+plt = lazy_import('matplotlib.pyplot')
 
 
 def set_seed(seed: int) -> None:
@@ -64,6 +70,7 @@ def print_config_summary(args, config=None):
             args = vars(args)
         keys = args.keys()
         # Initialize table
+        from texttable import Texttable
         table = Texttable()
         # Add rows to the table under two columns ("Parameter", "Value").
         table.add_rows([["Parameter", "Value"]] + [[k.replace("_", " ").capitalize(), args[k]] for k in keys])
@@ -95,76 +102,253 @@ def mkdir(directory: str) -> None:
         os.makedirs(directory)
 
 
-def save_model(model: Module, filepath: str) -> None:
+def save_model(model: 'torch.nn.Module', filepath: str, max_shard_size: int = None, num_workers: int = None,
+               incremental: bool = False, tag: str = None, codec: str = None, dtype: str = None) -> None:
     """
     保存 PyTorch模型的状态字典到指定的文件路径
     :param model: PyTorch模型实例
-    :param filepath: 要保存模型的文件路径
+    :param filepath: 要保存模型的文件路径，分片格式和增量格式时为目录
+    :param max_shard_size: 每个分片的最大字节数，为 None 时保存为单个文件
+    :param num_workers: 分片格式下并行写入的线程数
+    :param incremental: 是否使用增量格式，只写入与之前版本相比发生变化的张量
+    :param tag: 增量格式下这个版本的备注
+    :param codec: 压缩算法，'auto'、'zstd'、'lz4'、'zlib' 或 'none'，为 None 时不压缩
+    :param dtype: 浮点张量的保存精度，'fp16' 或 'bf16'，读取时会自动转换回原精度
     :return: None
     """
+    if incremental:
+        DeltaCheckpointStore(filepath).save(model.state_dict(), tag=tag)
+        return
+    if max_shard_size is not None:
+        save_sharded(model.state_dict(), filepath, max_shard_size=max_shard_size, num_workers=num_workers,
+                     codec=codec, dtype=dtype)
+        return
+    if codec is not None or dtype is not None:
+        save_compressed(model.state_dict(), filepath, codec=codec or 'none', dtype=dtype)
+        return
     torch.save(model.state_dict(), filepath)
 
 
-def load_model(model: Module, filepath: str) -> Module:
+def load_state_dict(filepath: str, device=None, mmap: bool = False, weights_only: bool = None,
+                    prefixes: list = None, num_workers: int = None) -> dict:
+    """
+    读取保存的状态字典，支持内存映射、直接放到目标设备以及只读取部分参数
+    :param filepath: 已保存模型的文件路径，可以是单个文件，也可以是分片格式或增量格式的目录（读取最新版本）
+    :param device: 目标设备，例如 'cpu'、'cuda:0'，为 None 时保持保存时的设备
+    :param mmap: 是否使用内存映射，开启后张量只有在被访问时才会从磁盘读入（压缩文件会忽略该选项）
+    :param weights_only: 是否只反序列化张量等安全类型，为 None 时使用 torch.load 的默认值
+    :param prefixes: 只保留以这些前缀开头的参数，例如 ['encoder.']，为 None 时保留全部参数
+    :param num_workers: 分片格式下并行读取的线程数
+    :return: 状态字典
+    """
+    if is_delta_store(filepath):
+        return DeltaCheckpointStore(filepath).load(device=device, mmap=mmap, weights_only=weights_only,
+                                                   prefixes=prefixes, num_workers=num_workers)
+    if is_sharded_checkpoint(filepath):
+        return load_sharded(filepath, device=device, mmap=mmap, weights_only=weights_only, prefixes=prefixes,
+                            num_workers=num_workers)
+
+    kwargs = {}
+    if weights_only is not None:
+        kwargs['weights_only'] = weights_only
+    if is_compressed_checkpoint(filepath):
+        state_dict = load_compressed(filepath, device='cpu' if mmap else device, weights_only=weights_only)
+    elif mmap:
+        # 先映射到 CPU，筛选之后再把需要的张量放到目标设备，未选中的参数不会被读入内存
+        try:
+            state_dict = torch.load(filepath, map_location='cpu', mmap=True, **kwargs)
+        except RuntimeError:
+            # 旧的（非 zip）格式不支持 mmap，退回到普通读取
+            state_dict = torch.load(filepath, map_location='cpu', **kwargs)
+    else:
+        state_dict = torch.load(filepath, map_location=device, **kwargs)
+
+    if prefixes is not None:
+        prefixes = tuple(prefixes)
+        state_dict = {k: v for k, v in state_dict.items() if k.startswith(prefixes)}
+    if mmap and device is not None:
+        state_dict = {k: v.to(device) for k, v in state_dict.items()}
+    return state_dict
+
+
+def load_model(model: 'torch.nn.Module', filepath: str, device=None, mmap: bool = False, weights_only: bool = None,
+               prefixes: list = None, strict: bool = None, assign: bool = False,
+               num_workers: int = None) -> 'torch.nn.Module':
     """
     加载保存的 PyTorch 模型状态字典到指定的模型实例中
     :param model: PyTorch 模型实例（空的，用于加载参数）
-    :param filepath: 已保存模型的文件路径
+    :param filepath: 已保存模型的文件路径，可以是单个文件，也可以是分片格式或增量格式的目录
+    :param device: 目标设备，为 None 时保持保存时的设备
+    :param mmap: 是否使用内存映射按需读取张量
+    :param weights_only: 是否只反序列化张量等安全类型
+    :param prefixes: 只加载以这些前缀开头的参数，例如 ['encoder.']
+    :param strict: 是否要求参数名完全匹配，为 None 时只在加载全部参数的情况下严格匹配
+    :param assign: 为 True 时直接使用读取的张量作为模型参数，省去一次拷贝（需要 torch>=2.1）
+    :param num_workers: 分片格式下并行读取的线程数
     :return: 已加载模型参数的 PyTorch 模型实例
     """
+    state_dict = load_state_dict(filepath, device=device, mmap=mmap, weights_only=weights_only, prefixes=prefixes,
+                                 num_workers=num_workers)
+    if strict is None:
+        strict = prefixes is None
     # 加载模型的状态字典到指定的模型实例中
-    model.load_state_dict(torch.load(filepath))
+    if assign:
+        model.load_state_dict(state_dict, strict=strict, assign=True)
+    else:
+        model.load_state_dict(state_dict, strict=strict)
     return model
 
 
-# 已经有了日志类了，这个可以不使用了
-def get_logger(name: str, save_dir: str, file_name: str):
+class _DeferredQueueHandler(QueueHandler):
+    """只在调用线程中合并日志参数，时间格式化和写文件都交给后台线程"""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# logger 名称 -> (日志文件路径, QueueListener)，保证同一个 logger 只配置一次
+_log_listeners = {}
+
+
+def _stop_log_listener(name: str) -> None:
+    listener = _log_listeners.pop(name, (None, None))[1]
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def get_logger(name: str, save_dir: str, file_name: str, use_queue: bool = True, buffer_size: int = 64):
     """
-    日志
+    日志，Logger.get_logger 也使用这个函数
+    同一个 name 重复调用时直接返回已经配置好的 logger，不会重复添加 handler
     :param name: logger名称
     :param save_dir: 日志保存的目录
     :param file_name: 日志保存的文件名
+    :param use_queue: 是否通过队列在后台线程中格式化和写入日志，训练线程只需要把记录放入队列
+    :param buffer_size: 后台线程中文件日志的缓冲条数，WARNING 及以上级别的日志会立即写入
     :return: logger
     """
     logger = logging.getLogger(name)
+    log_path = os.path.abspath(os.path.join(save_dir, file_name)) if save_dir else None
+    if name in _log_listeners and _log_listeners[name][0] == log_path and logger.handlers:
+        return logger
+
+    # 日志文件发生变化时，移除之前添加的 handler 后重新配置
+    _stop_log_listener(name)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
     logger.setLevel(logging.INFO)
+    logger.propagate = False
 
     ch = logging.StreamHandler(stream=sys.stdout)
     ch.setLevel(logging.INFO)
     formatter = logging.Formatter("%(asctime)s %(name)s %(levelname)s: %(message)s", datefmt='%Y/%m/%d %I:%M:%S')
     ch.setFormatter(formatter)
-    logger.addHandler(ch)
+    handlers = [ch]
 
     if save_dir:
-        fh = logging.FileHandler(os.path.join(save_dir, file_name))
+        fh = logging.FileHandler(log_path)
         fh.setLevel(logging.INFO)
         fh.setFormatter(formatter)
-        logger.addHandler(fh)
-
+        if use_queue:
+            # 在后台线程中攒够 buffer_size 条再写文件
+            fh = MemoryHandler(buffer_size, flushLevel=logging.WARNING, target=fh)
+        handlers.append(fh)
+
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(_DeferredQueueHandler(log_queue))
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+        listener = None
+    _log_listeners[name] = (log_path, listener)
     return logger
 
 
-def create_exp_folder(base_dir: str):
+def close_logger(name: str) -> None:
     """
-    检查并创建按照序号递增的实验文件夹
+    停止后台线程并写入缓冲中的日志，程序退出时会自动调用
+    :param name: logger名称
+    :return: None
+    """
+    _stop_log_listener(name)
+    logger = logging.getLogger(name)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+
+@atexit.register
+def _close_all_loggers() -> None:
+    for name in list(_log_listeners):
+        close_logger(name)
+
+
+def log_every(logger, step: int, every: int, msg: str, *args) -> None:
+    """
+    每 every 步记录一次日志，用于每个 step 都会调用的地方
+    参数在真正需要记录时才会被格式化，例如 log_every(logger, step, 100, 'step %d loss %.4f', step, loss)
+    :param logger: logger
+    :param step: 当前步数
+    :param every: 记录间隔
+    :param msg: 日志内容（%-格式）
+    :param args: 日志参数
+    :return: None
+    """
+    if step % every == 0 and logger.isEnabledFor(logging.INFO):
+        logger.info(msg, *args)
+
+
+EXP_FOLDER_PATTERN = re.compile(r'exp(\d+)')
+
+
+def create_exp_folder(base_dir: str, registry=None, max_retries: int = 10000):
+    """
+    检查并创建按照序号递增的实验文件夹，多个进程同时调用时也不会得到同一个文件夹
     :param base_dir: 基础目录路径，用于存放实验文件夹
+    :param registry: 可选的 ExperimentRegistry，创建后在数据库中注册这次实验
+    :param max_retries: 序号被其他进程占用时的最大重试次数
     :return: 创建的实验文件夹路径
     """
-    exp_num = 1
-    exp_folder = os.path.join(base_dir, f"exp{exp_num}")
-
-    # 检查是否存在该实验文件夹，如果存在则递增序号直到找到未被占用的序号
-    while os.path.exists(exp_folder):
+    os.makedirs(base_dir, exist_ok=True)
+
+    # 只遍历一次目录，找到当前最大的序号，而不是逐个检查 exp1、exp2、... 是否存在
+    exp_num = 0
+    with os.scandir(base_dir) as entries:
+        for entry in entries:
+            match = EXP_FOLDER_PATTERN.fullmatch(entry.name)
+            if match is not None:
+                exp_num = max(exp_num, int(match.group(1)))
+
+    # os.mkdir 是原子操作，多个任务同时启动时只有一个能创建成功，其余的递增序号后重试
+    for _ in range(max_retries):
         exp_num += 1
         exp_folder = os.path.join(base_dir, f"exp{exp_num}")
+        try:
+            os.mkdir(exp_folder)
+            break
+        except FileExistsError:
+            continue
+    else:
+        raise RuntimeError(f'Failed to create an experiment folder in {base_dir} after {max_retries} attempts')
 
-    # 创建实验文件夹
-    os.makedirs(exp_folder)
+    if registry is not None:
+        registry.register_run(exp_folder)
     return exp_folder
 
 
-def get_exp_sub_folder_path(output_dir):
-    output_dir = create_exp_folder(output_dir)
+def get_exp_sub_folder_path(output_dir, registry=None):
+    output_dir = create_exp_folder(output_dir, registry=registry)
     log_dir = os.path.join(output_dir, 'log')
     model_dir = os.path.join(output_dir, 'model')
     figures_dir = os.path.join(output_dir, 'figures')
@@ -174,7 +358,66 @@ def get_exp_sub_folder_path(output_dir):
     return log_dir, model_dir, figures_dir
 
 
-def plot_dict_to_individual_files(metric: defaultdict, folder_path: str):
+def render_metric_plot(key: str, value, folder_path: str = None, save_pdf: bool = True):
+    """
+    使用面向对象的 Figure 和 Agg 画布绘制一个指标的曲线，不依赖 pyplot 的全局状态，可以在子进程中调用
+    布局只在 Agg 画布上计算一次，PNG 直接从已经渲染好的像素缓冲中写出
+    :param key: 指标名
+    :param value: 每个 epoch 的数值
+    :param folder_path: 保存目录，为 None 时不保存
+    :param save_pdf: 是否同时保存单独的 PDF 文件
+    :return: matplotlib.figure.Figure
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.image import imsave
+
+    fig = Figure(figsize=(8, 6))  # 设置图像尺寸
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(value)
+    ax.set_xlabel('Epochs')  # x轴标签
+    ax.set_ylabel(key)  # y轴标签（使用键作为y轴标签）
+
+    if folder_path is not None:
+        name = f'{key.lower().replace(" ", "_")}_plot'
+        canvas.draw()
+        # 构建保存路径并保存为 PNG 文件
+        imsave(os.path.join(folder_path, 'png', f'{name}.png'), np.asarray(canvas.buffer_rgba()), dpi=fig.dpi)
+        if save_pdf:
+            # 构建保存路径并保存为 PDF 文件
+            fig.savefig(os.path.join(folder_path, 'pdf', f'{name}.pdf'), format='pdf')
+    return fig
+
+
+def _render_metric_file(item):
+    # 进程池中执行，只返回文件名，避免把 Figure 传回主进程
+    key, value, folder_path, save_pdf = item
+    render_metric_plot(key, value, folder_path, save_pdf)
+    return key
+
+
+def plot_dict_to_individual_files(metric: defaultdict, folder_path: str, num_workers: int = 1,
+                                  single_pdf: bool = False, cache=None):
+    """
+    把每个指标画成单独的图，保存到 folder_path/pdf 和 folder_path/png
+    :param metric: 指标名 -> 每个 epoch 的数值
+    :param folder_path: 保存目录
+    :param num_workers: 并行绘图的进程数，为 1 时在当前进程中依次绘制，为 None 时使用 CPU 核数；single_pdf 时不使用
+    :param single_pdf: 为 True 时所有指标写入同一个多页 PDF（folder_path/pdf/metrics.pdf），而不是每个指标一个文件
+    :param cache: plot_utils/figure_cache.py 中的 FigureCache，指标没有变化时直接复用之前生成的文件
+    """
+    if cache is not None:
+        names = [f'{key.lower().replace(" ", "_")}_plot' for key in metric]
+        outputs = [os.path.join(folder_path, 'png', f'{name}.png') for name in names]
+        if single_pdf:
+            outputs.append(os.path.join(folder_path, 'pdf', 'metrics.pdf'))
+        else:
+            outputs += [os.path.join(folder_path, 'pdf', f'{name}.pdf') for name in names]
+        return cache.render(plot_dict_to_individual_files, outputs, (dict(metric), folder_path),
+                            dict(num_workers=num_workers, single_pdf=single_pdf), ignore=('num_workers',),
+                            depends=(render_metric_plot,))
+
     def set_sci_style():
         # 设置 Matplotlib 样式为 SCI 形式
         plt.style.use('seaborn-white')  # 使用白色背景
@@ -190,61 +433,49 @@ def plot_dict_to_individual_files(metric: defaultdict, folder_path: str):
     # # 应用科学风格样式
     # set_sci_style()
 
-    # 遍历字典中的键值对，并绘制每个键值对对应的图表
-    for key, value in metric.items():
-        plt.figure(figsize=(8, 6))  # 设置图像尺寸
-
-        plt.plot(value)
-        plt.xlabel('Epochs')  # x轴标签
-        plt.ylabel(key)  # y轴标签（使用键作为y轴标签）
-
-        # 构建保存路径并保存为 PDF 文件
-        pdf_save_path = os.path.join(folder_path, 'pdf', f'{key.lower().replace(" ", "_")}_plot.pdf')
-        plt.savefig(pdf_save_path, format='pdf')  # 保存为 PDF 格式
-
-        # 构建保存路径并保存为 PNG 文件
-        png_save_path = os.path.join(folder_path, 'png', f'{key.lower().replace(" ", "_")}_plot.png')
-        plt.savefig(png_save_path, format='png')  # 保存为 PNG 格式
-
-        plt.close()  # 关闭当前图表
-
+    if single_pdf:
+        # 多页 PDF 只能由一个进程写入，每张图在当前进程中只创建一次，同时写 PNG 和 PDF 的一页
+        from matplotlib.backends.backend_pdf import PdfPages
+        with PdfPages(os.path.join(folder_path, 'pdf', 'metrics.pdf')) as pdf:
+            for key, value in metric.items():
+                pdf.savefig(render_metric_plot(key, list(value), folder_path, save_pdf=False))
+        return
 
-def extract_last_two_values(directory):
-    max_test_auc_values = []
-    max_test_ap_values = []
-    max_values = {}
+    items = [(key, list(value), folder_path, True) for key, value in metric.items()]
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = min(num_workers, len(items))
 
-    # 遍历目录下的exp文件夹
-    for exp_folder in os.listdir(directory):
-        exp_path = os.path.join(directory, exp_folder)
-        if os.path.isdir(exp_path):
-            log_path = os.path.join(exp_path, 'log', '4.best_metric.log')
-
-            # 检查log文件是否存在
-            if os.path.exists(log_path):
-                with open(log_path, 'r') as file:
-                    lines = file.readlines()
-
-                    # todo: 不同的评价指标所在位置不一样就需要更改此处
-                    # 提取倒数第二行和倒数第一行的数值
-                    test_auc = float(lines[-1].split()[-1][: -1])
-                    test_ap = float(lines[-2].split()[-1][: -1])
-
-                    max_test_auc_values.append(test_auc)
-                    max_test_ap_values.append(test_ap)
-
-                    max_values[test_auc] = (exp_folder, 'Test AUC')
-                    max_values[test_ap] = (exp_folder, 'Test AP')
-
-    max_test_auc = max(max_test_auc_values)
-    max_test_ap = max(max_test_ap_values)
+    # 遍历字典中的键值对，并绘制每个键值对对应的图表
+    if num_workers > 1:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            list(executor.map(_render_metric_file, items))
+    else:
+        for item in items:
+            _render_metric_file(item)
 
-    # 获取最大值对应的exp文件夹和指标
-    max_test_auc_exp, metric_auc = max_values[max_test_auc]
-    max_test_ap_exp, metric_ap = max_values[max_test_ap]
 
-    print("Max Test AUC:", (max_test_auc, max_test_auc_exp, metric_auc))
-    print("Max Test AP:", (max_test_ap, max_test_ap_exp, metric_ap))
+def extract_last_two_values(directory, metrics: list = None) -> list:
+    """
+    汇总 directory 下所有实验的最优指标，并打印每个指标的最优值以及对应的实验
+    :param directory: 存放 exp 文件夹的目录
+    :param metrics: 需要打印的指标名，为 None 时与之前一样使用 4.best_metric.log 中的最后两个指标
+    :return: ResultRow(exp, metric, value, epoch, mode) 列表
+    """
+    rows = scan_results(directory)
+    if metrics is None:
+        names = list(dict.fromkeys(row.metric for row in rows))
+        metrics = names[-2:][::-1]
+
+    best = best_by_metric(rows)
+    for metric in metrics:
+        if metric not in best:
+            continue
+        value, best_rows = best[metric]
+        # 最优值相同的实验都会被列出
+        prefix = 'Max' if best_rows[0].mode == 'max' else 'Min'
+        print(f"{prefix} {metric}:", (value, ', '.join(row.exp for row in best_rows), metric))
+    return rows
 
 
 def write_to_excel(parameters: list, values: list, metric: dict, compare: list = None, verbose: bool = True,
@@ -260,6 +491,10 @@ def write_to_excel(parameters: list, values: list, metric: dict, compare: list =
     :param filename: 输出的Excel文件名（默认为'output.xlsx'）
     """
 
+    from openpyxl import Workbook, load_workbook
+    from openpyxl.utils import get_column_letter
+    from openpyxl.styles import Font, Alignment
+
     def find_first_empty_column(ws):
         """找到工作表中第一行第一个两列都是空的列"""
         col = 1
@@ -333,3 +568,112 @@ def write_to_excel(parameters: list, values: list, metric: dict, compare: list =
 
     wb.save(filename)
     print(f"Data written to {filename} successfully.")
+
+
+def best_epoch_indices(metric: dict, compare: list = None) -> 'np.ndarray':
+    """
+    一次性计算每个指标取得最优值的 epoch 下标
+    :param metric: 指标字典，指标名 -> 每个 epoch 的数值列表（长度相同）
+    :param compare: 与 write_to_excel 相同，1 表示越大越好，否则越小越好（默认为None，全部越大越好）
+    :return: 每个指标的最优 epoch 下标
+    """
+    if compare is None:
+        compare = [1] * len(metric)
+    values = np.asarray(list(metric.values()), dtype=float)
+    larger = np.asarray(compare) == 1
+    # 越小越好的指标取相反数，这样所有指标都可以用一次 argmax
+    return np.argmax(np.where(larger[:, None], values, -values), axis=1)
+
+
+def summarize_runs(runs: list, compare: list = None, verbose: bool = True) -> list:
+    """
+    整理多次实验的最优指标
+    :param runs: [(parameters, values, metric), ...]，与 write_to_excel 的前三个参数相同
+    :param compare: 比较指标（默认为None）
+    :param verbose: 是否一起写入参数和参数值（默认为True）
+    :return: [(参数字符串, [(指标名, 最优 epoch 下标, {指标名: 该 epoch 的值}), ...]), ...]
+    """
+    summary = []
+    for parameters, values, metric in runs:
+        if verbose:
+            parameters_pair = '_'.join(f'{param}: {value}' for param, value in zip(parameters, values))
+        else:
+            parameters_pair = '_'.join(str(value) for value in values)
+        best = []
+        for key, index in zip(metric.keys(), best_epoch_indices(metric, compare)):
+            best.append((key, int(index), {k: v[index] for k, v in metric.items()}))
+        summary.append((parameters_pair, best))
+    return summary
+
+
+def export_results(runs: list, filename: str = 'output.xlsx', compare: list = None, verbose: bool = True) -> None:
+    """
+    一次导出多次实验的结果，用于替代逐个调用 write_to_excel
+    根据文件后缀选择格式：.xlsx 与 write_to_excel 的排版相同（每次实验占一组列），使用 openpyxl 的只写模式；
+    .csv 和 .parquet 每行是一次实验的一个指标，.parquet 需要安装 pandas 和 pyarrow
+    注意：会覆盖已经存在的文件，而不是像 write_to_excel 一样追加
+    :param runs: [(parameters, values, metric), ...]，与 write_to_excel 的前三个参数相同
+    :param filename: 输出的文件名（默认为'output.xlsx'）
+    :param compare: 比较指标（默认为None）
+    :param verbose: 是否一起写入参数和参数值（默认为True）
+    """
+    summary = summarize_runs(runs, compare, verbose)
+    ext = os.path.splitext(filename)[1].lower()
+
+    if ext in ('.csv', '.parquet'):
+        metric_names = list(dict.fromkeys(k for _, best in summary for _, _, tmp in best for k in tmp))
+        header = ['parameters', 'metric', 'best_epoch'] + metric_names
+        rows = [[parameters_pair, key, index + 1] + [tmp.get(k) for k in metric_names]
+                for parameters_pair, best in summary for key, index, tmp in best]
+        if ext == '.csv':
+            with open(filename, 'w', encoding='utf8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+        else:
+            import pandas as pd
+            pd.DataFrame(rows, columns=header).to_parquet(filename, index=False)
+        print(f"Data written to {filename} successfully.")
+        return
+
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+    from openpyxl.styles import Font, Alignment
+
+    # 先在内存中排好两行数据，列宽直接根据要写入的数据计算
+    row1, row2 = [], []
+    for i, (parameters_pair, best) in enumerate(summary):
+        if i > 0:
+            # 每次实验之间空一列
+            row1.append(None)
+            row2.append(None)
+        row1.append(parameters_pair)
+        row2.append(None)
+        for key, _, tmp in best:
+            row1.append('Max_' + key)
+            row2.append(str(tmp))
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for col, (v1, v2) in enumerate(zip(row1, row2), start=1):
+        max_length = max(len(str(v1)) if v1 is not None else 0, len(str(v2)) if v2 is not None else 0)
+        ws.column_dimensions[get_column_letter(col)].width = max_length + 2
+
+    font = Font(name='Times New Roman')
+    alignment = Alignment(horizontal='center', vertical='center')
+
+    def styled(row):
+        cells = []
+        for value in row:
+            cell = WriteOnlyCell(ws, value=value)
+            if value is not None:
+                cell.font = font
+                cell.alignment = alignment
+            cells.append(cell)
+        return cells
+
+    ws.append(styled(row1))
+    ws.append(styled(row2))
+    wb.save(filename)
+    print(f"Data written to {filename} successfully.")
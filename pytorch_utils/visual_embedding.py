@@ -2,32 +2,286 @@
 # @Time    : 2023/12/21
 # @Author  : Zhong Zhijie
 
-import numpy as np
-from matplotlib import pyplot as plt
-from sklearn.manifold import TSNE
+import hashlib
+import os
+from collections import OrderedDict
 
+from .lazy import lazy_import
 
-def plot_embeddings(embeddings, features, labels):
+np = lazy_import('numpy')
+plt = lazy_import('matplotlib.pyplot')
+
+# 用法：
+'''
+    # 20 万个节点：先 PCA 到 50 维，按类别分层抽 2 万个点做 t-SNE，其余点按近邻放置
+    node_pos = plot_embeddings(embeddings, features, labels, pca_dim=50, max_points=20000, cache_dir='outputs/tsne')
+    # 只修改样式再画一次时直接读取缓存的坐标
+    plot_embeddings(embeddings, features, labels, pca_dim=50, max_points=20000, cache_dir='outputs/tsne',
+                    s=2, legend=True)
+'''
+
+# render='auto' 时按点数选择绘制方式：矢量点 -> 栅格化的点 -> 按类别聚合的密度图
+RASTERIZE_ABOVE = 20000
+DENSITY_ABOVE = 200000
+
+_projection_cache = OrderedDict()  # 缓存键 -> 二维坐标，进程内缓存最近几次的投影结果
+_MAX_CACHED_PROJECTIONS = 8
+
+
+def to_numpy(x):
+    """把 torch.Tensor、列表等转换为 numpy 数组"""
+    if hasattr(x, 'detach') and hasattr(x, 'cpu'):  # torch.Tensor
+        x = x.detach().cpu().numpy()
+    return np.asarray(x)
+
+
+def embedding_digest(embeddings, labels=None, **params) -> str:
+    """
+    由嵌入、标签和投影参数计算缓存的键
+    :param embeddings: [N, D] 的 numpy 数组
+    :param labels: [N] 的标签，分层抽样时会影响结果
+    :param params: 投影参数
+    :return: 十六进制字符串
+    """
+    h = hashlib.blake2b(digest_size=20)
+    for array in (embeddings, labels):
+        if array is None:
+            h.update(b'none')
+            continue
+        array = np.ascontiguousarray(array)
+        h.update(f'{array.dtype}{array.shape}'.encode())
+        h.update(array.view(np.uint8).reshape(-1) if array.dtype != object else repr(array.tolist()).encode())
+    h.update(repr(sorted(params.items())).encode())
+    return h.hexdigest()
+
+
+def sample_indices(n: int, max_points: int, labels=None, method: str = 'stratified', random_state: int = 0):
+    """
+    从 n 个点中抽取 max_points 个点作为 t-SNE 的样本
+    :param n: 点数
+    :param max_points: 抽取的点数
+    :param labels: [n] 的标签，method='stratified' 时使用
+    :param method: 'stratified' 按类别比例抽样，每个类别至少保留一个点；'landmark' 与标签无关的均匀抽样
+    :param random_state: 随机种子
+    :return: 排好序的下标数组
+    """
+    rng = np.random.default_rng(random_state)
+    if n <= max_points:
+        return np.arange(n)
+    if method == 'landmark' or labels is None:
+        return np.sort(rng.choice(n, size=max_points, replace=False))
+    if method != 'stratified':
+        raise ValueError(f'unknown sampling method {method!r}')
+
+    classes, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    quota = np.maximum(np.floor(counts * max_points / n).astype(np.int64), 1)
+    quota = np.minimum(quota, counts)
+    # 随机打乱之后按类别稳定排序，每个类别取前 quota 个，即每个类别内的无放回随机抽样
+    order = rng.permutation(n)
+    order = order[np.argsort(inverse[order], kind='stable')]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(n) - np.repeat(starts, counts)
+    return np.sort(order[rank < np.repeat(quota, counts)])
+
+
+def place_out_of_sample(reference, reference_pos, queries, n_neighbors: int = 5, n_jobs: int = -1,
+                        chunk_size: int = 65536):
+    """
+    把没有参与 t-SNE 的点放到其在高维空间中最近的 n_neighbors 个样本点二维坐标的距离加权平均处
+    :param reference: [M, D] 参与 t-SNE 的点
+    :param reference_pos: [M, 2] 它们的二维坐标
+    :param queries: [K, D] 需要放置的点
+    :param n_neighbors: 近邻数
+    :param n_jobs: 近邻搜索的并行进程数，-1 表示使用所有 CPU
+    :param chunk_size: 每次查询的点数，限制距离矩阵的内存占用
+    :return: [K, 2] 二维坐标
+    """
+    from sklearn.neighbors import NearestNeighbors
+
+    n_neighbors = min(n_neighbors, reference.shape[0])
+    nn = NearestNeighbors(n_neighbors=n_neighbors, n_jobs=n_jobs).fit(reference)
+    positions = np.empty((queries.shape[0], reference_pos.shape[1]), dtype=reference_pos.dtype)
+    for start in range(0, queries.shape[0], chunk_size):
+        dist, idx = nn.kneighbors(queries[start:start + chunk_size])
+        weights = 1.0 / np.maximum(dist, 1e-12)
+        weights /= weights.sum(axis=1, keepdims=True)
+        positions[start:start + chunk_size] = np.einsum('qk,qkc->qc', weights, reference_pos[idx])
+    return positions
+
+
+def project_embeddings(embeddings, labels=None, pca_dim: int = None, max_points: int = None,
+                       sample: str = 'stratified', n_neighbors: int = 5, perplexity: float = 30.0,
+                       n_jobs: int = -1, random_state: int = 0, cache_dir: str = None):
+    """
+    用 t-SNE 把嵌入投影到二维
+    1. 指定 pca_dim 且维度大于 pca_dim 时先用随机化 PCA 降维，加快近邻搜索（例如 50）
+    2. 点数大于 max_points 时只对抽样的点做 t-SNE，其余点按近邻放置
+    3. 结果按嵌入和参数的哈希缓存，只修改绘图样式时不需要重新计算
+    :param embeddings: [N, D] 的嵌入，numpy 数组或者 torch.Tensor
+    :param labels: [N] 的标签，分层抽样时使用
+    :param pca_dim: PCA 降维后的维度，默认为 None，不降维
+    :param max_points: 参与 t-SNE 的最大点数，None 表示使用所有点
+    :param sample: 抽样方法，'stratified' 或 'landmark'
+    :param n_neighbors: 放置其余点时使用的近邻数
+    :param perplexity: t-SNE 的 perplexity
+    :param n_jobs: t-SNE 和近邻搜索的并行进程数，-1 表示使用所有 CPU
+    :param random_state: 随机种子
+    :param cache_dir: 坐标的缓存目录，None 表示只在当前进程内缓存
+    :return: [N, 2] 的 float32 坐标，每次调用都返回新的数组
+    """
+    embeddings = to_numpy(embeddings)
+    embeddings = embeddings.reshape(embeddings.shape[0], -1)
+    if labels is not None:
+        labels = to_numpy(labels)
+        labels = labels.reshape(labels.shape[0], -1)[:, 0]
+
+    key = embedding_digest(embeddings, labels if sample == 'stratified' and max_points else None,
+                           pca_dim=pca_dim, max_points=max_points, sample=sample, n_neighbors=n_neighbors,
+                           perplexity=perplexity, random_state=random_state)
+    if key in _projection_cache:
+        _projection_cache.move_to_end(key)
+        return _projection_cache[key].copy()  # 返回副本，调用者原地修改结果时不会影响缓存
+    cache_path = os.path.join(cache_dir, f'{key}.npy') if cache_dir is not None else None
+    if cache_path is not None and os.path.exists(cache_path):
+        node_pos = np.load(cache_path)
+    else:
+        node_pos = _project(embeddings, labels, pca_dim, max_points, sample, n_neighbors, perplexity, n_jobs,
+                            random_state)
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f'{cache_path}.tmp.{os.getpid()}.npy'
+            np.save(tmp_path, node_pos)
+            os.replace(tmp_path, cache_path)
+
+    _projection_cache[key] = node_pos
+    while len(_projection_cache) > _MAX_CACHED_PROJECTIONS:
+        _projection_cache.popitem(last=False)
+    return node_pos.copy()
+
+
+def _project(embeddings, labels, pca_dim, max_points, sample, n_neighbors, perplexity, n_jobs, random_state):
+    from sklearn.decomposition import PCA
+    from sklearn.manifold import TSNE
+
+    x = embeddings.astype(np.float32, copy=False)
+    if pca_dim is not None and x.shape[1] > pca_dim and x.shape[0] > pca_dim:
+        x = PCA(n_components=pca_dim, svd_solver='randomized', random_state=random_state).fit_transform(x)
+        x = x.astype(np.float32, copy=False)
+
+    n = x.shape[0]
+    index = sample_indices(n, max_points, labels, sample, random_state) if max_points else np.arange(n)
+    model = TSNE(n_components=2, init='pca', perplexity=min(perplexity, len(index) - 1),
+                 n_jobs=n_jobs, random_state=random_state)
+    node_pos = np.empty((n, 2), dtype=np.float32)
+    node_pos[index] = model.fit_transform(x[index])
+
+    if len(index) < n:
+        rest = np.ones(n, dtype=bool)
+        rest[index] = False
+        node_pos[rest] = place_out_of_sample(x[index], node_pos[index], x[rest], n_neighbors, n_jobs)
+    return node_pos
+
+
+def density_image(node_pos, inverse, colors, bins: int = 512):
+    """
+    把点按类别分箱，得到与点数无关的 RGBA 图像：颜色为格子内各类别颜色按点数的加权平均，透明度随点数对数增长
+    :param node_pos: [N, 2] 坐标
+    :param inverse: [N] 类别编号（0 到 C-1）
+    :param colors: [C, 4] 类别颜色
+    :param bins: 每个方向的格子数
+    :return: (image, extent)，image 为 [bins, bins, 4]，extent 为 (xmin, xmax, ymin, ymax)
+    """
+    lo = node_pos.min(axis=0)
+    hi = node_pos.max(axis=0)
+    pad = np.maximum((hi - lo) * 0.01, 1e-6)
+    lo, hi = lo - pad, hi + pad
+    cell = np.clip(((node_pos - lo) / (hi - lo) * bins).astype(np.int64), 0, bins - 1)
+    n_classes = colors.shape[0]
+    counts = np.bincount((inverse * bins + cell[:, 1]) * bins + cell[:, 0], minlength=n_classes * bins * bins)
+    counts = counts.reshape(n_classes, bins, bins).astype(np.float32)
+
+    total = counts.sum(axis=0)
+    image = np.zeros((bins, bins, 4), dtype=np.float32)
+    image[..., :3] = np.tensordot(counts, colors[:, :3], axes=(0, 0)) / np.maximum(total, 1)[..., None]
+    image[..., 3] = np.log1p(total) / np.log1p(max(total.max(), 1))
+    return image, (lo[0], hi[0], lo[1], hi[1])
+
+
+def scatter_classes(node_pos, labels=None, s: float = 5, render: str = 'auto', bins: int = 512):
+    """
+    按类别画散点图
+    :param node_pos: [N, 2] 坐标
+    :param labels: [N] 标签
+    :param s: 点的大小
+    :param render: 'vector' 每个点都是矢量图形；'rasterized' 点层栅格化，坐标轴、图例等仍为矢量；
+                   'density' 按类别聚合成一张图像，绘制时间和 PDF 大小几乎与点数无关；
+                   'auto' 根据点数在三者之间选择
+    :param bins: render='density' 时每个方向的格子数
+    :return: 实际使用的绘制方式
+    """
+    n = node_pos.shape[0]
+    if render == 'auto':
+        render = 'vector' if n <= RASTERIZE_ABOVE else 'rasterized' if n <= DENSITY_ABOVE else 'density'
+    if labels is None:
+        classes, inverse = np.array([None]), np.zeros(n, dtype=np.int64)
+    else:
+        classes, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+        # 类别按第一次出现的顺序排列，与原来逐个节点收集类别时的颜色和图例顺序一致
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        classes, inverse = classes[order], rank[inverse.reshape(-1)]
+
+    if render in ('vector', 'rasterized'):
+        for i, c in enumerate(classes):
+            mask = inverse == i
+            plt.scatter(node_pos[mask, 0], node_pos[mask, 1], label=c, s=s,
+                        rasterized=render == 'rasterized')  # c=node_colors)
+    elif render == 'density':
+        from matplotlib.colors import to_rgba_array
+
+        cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        colors = to_rgba_array([cycle[i % len(cycle)] for i in range(len(classes))])
+        image, extent = density_image(node_pos, inverse, colors, bins)
+        plt.imshow(image, origin='lower', extent=extent, interpolation='nearest', aspect='auto')
+        for c, color in zip(classes, colors):
+            plt.scatter([], [], color=color, label=c, s=s)  # 只用于图例
+    else:
+        raise ValueError(f'unknown render mode {render!r}')
+    return render
+
+
+def plot_embeddings(embeddings, features=None, labels=None, s: float = 5, legend: bool = False, show: bool = True,
+                    render: str = 'auto', bins: int = 512, **kwargs):
+    """
+    画出嵌入的 t-SNE 可视化
+    :param embeddings: [N, D] 的嵌入
+    :param features: 节点特征，只使用前 features.shape[0] 个节点的嵌入
+    :param labels: [N] 或 [N, 1] 的标签
+    :param s: 点的大小
+    :param legend: 是否显示图例
+    :param show: 是否调用 plt.show()
+    :param render: 绘制方式，见 scatter_classes
+    :param bins: render='density' 时每个方向的格子数
+    :param kwargs: 传给 project_embeddings 的参数，例如 max_points、pca_dim、cache_dir
+    :return: [N, 2] 的坐标
+    """
     # norm = Normalized(embeddings)
     # embeddings = norm.MinMax()
 
-    emb_list = []
-    for k in range(features.shape[0]):
-        emb_list.append(embeddings[k])
-    emb_list = np.array(emb_list)
-
-    model = TSNE(n_components=2, init="pca")
-    # model = TSNE(n_components=2)
-    node_pos = model.fit_transform(emb_list)
+    embeddings = to_numpy(embeddings)
+    if features is not None:
+        embeddings = embeddings[:features.shape[0]]
+    if labels is not None:
+        labels = to_numpy(labels)
+        labels = labels.reshape(labels.shape[0], -1)[:embeddings.shape[0], 0]
 
-    color_idx = {}
-    for i in range(features.shape[0]):
-        color_idx.setdefault(labels[i][0], [])
-        color_idx[labels[i][0]].append(i)
+    node_pos = project_embeddings(embeddings, labels, **kwargs)
 
-    for c, idx in color_idx.items():
-        plt.scatter(node_pos[idx, 0], node_pos[idx, 1], label=c, s=5)  # c=node_colors)
+    scatter_classes(node_pos, labels, s=s, render=render, bins=bins)
     plt.axis('off')
-    # plt.legend()
-    plt.gca.legend_ = None
-    plt.show()
+    if legend:
+        plt.legend()
+    if show:
+        plt.show()
+    return node_pos
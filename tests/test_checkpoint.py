@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from pytorch_utils.checkpoint import DeltaCheckpointStore, state_dict_to_cpu
+
+
+def test_delta_store_detects_changes_in_fresh_state_dicts(tmp_path):
+    # 每次保存都是新分配的状态字典，地址可能复用且版本号都为 0，内容变化后必须写入新的 blob
+    model = torch.nn.Linear(64, 64)
+    store = DeltaCheckpointStore(str(tmp_path))
+    for _ in range(20):
+        with torch.no_grad():
+            model.weight.add_(1)
+        version = store.save(state_dict_to_cpu(model))
+        assert torch.equal(store.load(version)['weight'], model.weight)
+
+
+def test_delta_store_detects_changes_through_data(tmp_path):
+    weight = torch.zeros(3)
+    store = DeltaCheckpointStore(str(tmp_path))
+    first = store.save({'weight': weight})
+    weight.data[0] = 1  # 通过 .data 修改不会增加 _version
+    second = store.save({'weight': weight})
+    assert store.load(first)['weight'][0] == 0
+    assert store.load(second)['weight'][0] == 1
+
+
+def test_compact_keeps_in_flight_tmp_files_and_rejects_keep_last_zero(tmp_path):
+    store = DeltaCheckpointStore(str(tmp_path))
+    store.save({'weight': torch.zeros(3)})
+    store.save({'weight': torch.ones(3)})
+    tmp_file = os.path.join(store.blob_dir, 'ab', 'ab' * 20 + '.pt.tmp.1.2')
+    os.makedirs(os.path.dirname(tmp_file), exist_ok=True)
+    open(tmp_file, 'wb').close()
+
+    assert store.compact(keep_last=1) == 1
+    assert os.path.exists(tmp_file)
+    assert torch.equal(store.load()['weight'], torch.ones(3))
+    with pytest.raises(ValueError):
+        store.compact(keep_last=0)
+
+
+def test_concurrent_writers_do_not_overwrite_each_others_manifest(tmp_path, monkeypatch):
+    # 另一个进程在两次 listdir 之间抢先写入了版本 1：模拟为第二个 store 看到的版本列表已经过期
+    first = DeltaCheckpointStore(str(tmp_path))
+    second = DeltaCheckpointStore(str(tmp_path))
+    assert first.save({'weight': torch.zeros(3)}) == 1
+    monkeypatch.setattr(second, 'versions', lambda: [])
+
+    assert second.save({'weight': torch.ones(3)}) == 2
+    assert torch.equal(first.load(1)['weight'], torch.zeros(3))
+    assert torch.equal(first.load(2)['weight'], torch.ones(3))
+    assert sorted(os.listdir(first.manifest_dir)) == ['000001.json', '000002.json']
@@ -0,0 +1,39 @@
+import random
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from pytorch_utils.training_state import TrainingState
+
+
+def _draw():
+    return random.random(), np.random.rand(), torch.rand(1).item()
+
+
+def _components(device='cpu'):
+    model = torch.nn.Linear(3, 2).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-2)
+    return model, optimizer
+
+
+@pytest.mark.parametrize('map_location', [
+    'meta',
+    pytest.param('cuda:0', marks=pytest.mark.skipif(not torch.cuda.is_available(), reason='requires CUDA')),
+])
+def test_load_with_map_location_restores_rng_state(tmp_path, map_location):
+    model, optimizer = _components()
+    model(torch.randn(4, 3)).sum().backward()
+    optimizer.step()
+    state = TrainingState(str(tmp_path / 'state.pt'), trace_func=lambda *args: None)
+    state.save(5, metric={'loss': [1.0]}, model=model, optimizer=optimizer)
+    expected = _draw()
+
+    # 换设备恢复：组件的状态移动到 map_location，随机数状态仍然在 CPU 上恢复
+    model, optimizer = _components(map_location)
+    resumed = state.load(map_location=map_location, model=model, optimizer=optimizer)
+
+    assert resumed == {'epoch': 5, 'metric': {'loss': [1.0]}}
+    assert _draw() == expected
+    assert next(model.parameters()).device.type == torch.device(map_location).type